@@ -0,0 +1,60 @@
+from time import perf_counter
+import statistics
+import click
+import torch
+
+from dekun.core.lama import FourierUnit, FFCResidualBlock
+
+# Forward a fourier unit the way it was before the spectrum was built through views.
+def forward_reference(unit: FourierUnit, input: torch.Tensor):
+    fft = torch.fft.rfft2(input, norm="ortho")
+    processed = unit.convolutional(torch.cat([fft.real, fft.imag], dim=1))
+    half_channels = processed.shape[1] // 2
+
+    return torch.fft.irfft2(torch.complex(processed[:, :half_channels], processed[:, half_channels:]), s=(input.shape[2], input.shape[3]), norm="ortho")
+
+# Measure the median duration of a function in milliseconds.
+def measure(function, repeats: int):
+    for _ in range(3):
+        function()
+
+    durations = []
+
+    for _ in range(repeats):
+        start = perf_counter()
+        function()
+        durations.append((perf_counter() - start) * 1000)
+
+    return statistics.median(durations)
+
+# Benchmark the fourier unit against the concatenating forward and a residual block before and after folding.
+@click.command()
+@click.option("-c", "--channels", type=click.INT, default=1024)
+@click.option("-s", "--size", type=click.INT, default=32)
+@click.option("-b", "--batch-size", type=click.INT, default=1)
+@click.option("-r", "--repeats", type=click.INT, default=15)
+def benchmark_command(channels: int, size: int, batch_size: int, repeats: int):
+    torch.manual_seed(0)
+
+    unit = FourierUnit(channels // 2, channels // 2)
+    block = FFCResidualBlock(channels).eval()
+    global_input = torch.randn((batch_size, channels // 2, size, size))
+    input = torch.randn((batch_size, channels, size, size))
+
+    # Run a training step of a forward.
+    def train(forward):
+        forward().square().sum().backward()
+
+    with torch.no_grad():
+        print(f"Fourier unit (inference)  | Reference: {measure(lambda: forward_reference(unit, global_input), repeats):.2f}ms | Views: {measure(lambda: unit(global_input), repeats):.2f}ms")
+
+    print(f"Fourier unit (training)   | Reference: {measure(lambda: train(lambda: forward_reference(unit, global_input)), repeats):.2f}ms | Views: {measure(lambda: train(lambda: unit(global_input)), repeats):.2f}ms")
+
+    with torch.no_grad():
+        unfused = measure(lambda: block(input), repeats)
+        block.fuse()
+
+        print(f"Residual block            | Unfused: {unfused:.2f}ms | Fused: {measure(lambda: block(input), repeats):.2f}ms")
+
+if __name__ == "__main__":
+    benchmark_command()
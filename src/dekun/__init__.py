@@ -1,13 +1,12 @@
-from typing import Union
+from typing import Union, cast
 from pathlib import Path
 import click
 
-from dekun.core.playground.main import start_playground
 from dekun.inpainter.command import inpainter_command
 from dekun.marker.command import marker_command
-from dekun.core.editor.main import start_editor
-from dekun.inpainter.model import Inpainter
-from dekun.marker.model import Marker 
+from dekun.dataset.command import dataset_command
+
+# The servers and the models are imported inside the commands, so the CLI starts fast.
 
 # The root command group.
 @click.group()
@@ -18,25 +17,41 @@ def root_command():
 @click.command("editor")
 @click.argument("port", type=click.INT, default=8080)
 @click.option("-d", "--dataset", type=click.Path(True, file_okay=False), required=1)
-def editor_command(port: int, dataset: str):
-    start_editor(port, Path(dataset))
+@click.option("-c", "--cache-directory", type=click.Path(file_okay=False))
+@click.option("-s", "--cache-size", type=click.INT, default=1024)
+def editor_command(port: int, dataset: str, cache_directory: Union[str, None], cache_size: int):
+    from dekun.core.editor.main import start_editor
+
+    start_editor(port, Path(dataset), None if cache_directory == None else Path(cache_directory), cache_size * 1024 * 1024)
 
 # Start the model playground.
 @click.command("playground")
 @click.argument("port", type=click.INT, default=8080)
 @click.option("-m", "--marker", type=click.Path(True, dir_okay=False))
 @click.option("-i", "--inpainter", type=click.Path(True, dir_okay=False))
+@click.option("-b", "--batch-size", type=click.INT, default=8)
+@click.option("-w", "--batch-wait", type=click.FLOAT, default=5)
+@click.option("-C", "--compile", is_flag=True)
 @click.option("-D", "--device", type=click.Choice(["auto", "cpu", "cuda"]), default="auto")
-def playground_command(port: int, marker: Union[str, None], inpainter: Union[str, None], device: str): 
-    start_playground(
-        port,
-        
-        None if marker == None else Marker.load(device, Path(marker)),
-        None if inpainter == None else Inpainter.load(device, Path(inpainter))
-    )
+def playground_command(port: int, marker: Union[str, None], inpainter: Union[str, None], batch_size: int, batch_wait: float, compile: bool, device: str): 
+    from dekun.core.playground.main import start_playground
+    from dekun.inpainter.model import Inpainter
+    from dekun.marker.model import Marker
+
+    loaded_marker = None if marker == None else Marker.load(device, Path(marker))
+    loaded_inpainter = None if inpainter == None else Inpainter.load(device, Path(inpainter))
+
+    if compile:
+        if loaded_marker != None:
+            loaded_marker.compile(Path(cast(str, marker)))
+        if loaded_inpainter != None:
+            loaded_inpainter.compile(Path(cast(str, inpainter)))
+
+    start_playground(port, loaded_marker, loaded_inpainter, batch_size, batch_wait / 1000)
 
 root_command.add_command(marker_command)
 root_command.add_command(inpainter_command)
+root_command.add_command(dataset_command)
 root_command.add_command(editor_command)
 root_command.add_command(playground_command)
 
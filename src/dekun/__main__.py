@@ -0,0 +1,3 @@
+from dekun import root_command
+
+root_command()
@@ -0,0 +1,87 @@
+from math import log
+import random
+import torch
+
+from dekun.core.dataset import Dataset
+
+# Create the bucket resolutions (width, height) around a base size, every resolution is a multiple of the stride and has at most the area of the base size.
+def create_buckets(width: int, height: int, stride: int, max_ratio: float = 2.0):
+    if stride < 1:
+        raise ValueError(f"Invalid stride: {stride}")
+    if width % stride != 0 or height % stride != 0:
+        raise ValueError(f"Invalid base size: {width} x {height} (not divisible by {stride})")
+    if max_ratio < 1:
+        raise ValueError(f"Invalid max aspect ratio: {max_ratio}")
+
+    area = width * height
+    buckets = {(width, height)}
+
+    for side in range(stride, (area // stride) + 1, stride):
+        other_side = ((area // side) // stride) * stride
+
+        if other_side >= stride and 1 / max_ratio <= side / other_side <= max_ratio:
+            buckets.add((side, other_side))
+            buckets.add((other_side, side))
+
+    return sorted(buckets, key=lambda bucket: bucket[0] / bucket[1])
+
+# Find the index of the bucket with the closest aspect ratio.
+def nearest_bucket(buckets: list[tuple[int, int]], aspect_ratio: float):
+    return min(range(len(buckets)), key=lambda index: abs(log(buckets[index][0] / buckets[index][1]) - log(aspect_ratio)))
+
+# A batch sampler that groups the entries by aspect ratio, every batch only holds the entries of one bucket and the batches of the buckets are shuffled together.
+class BucketSampler(torch.utils.data.Sampler[list[int]]):
+
+    # Initialize a bucket sampler, the aspect ratios come from the dataset manifest and the entries with unknown sizes go into the bucket of the base size.
+    def __init__(self, dataset: Dataset, buckets: list[tuple[int, int]], batch_size: int, rank: int = 0, world_size: int = 1, default_aspect_ratio: float = 1.0):
+        if batch_size < 1:
+            raise ValueError(f"Invalid batch size: {batch_size}")
+
+        self.buckets = buckets
+        self.batch_size = batch_size
+        self.rank = rank
+        self.world_size = world_size
+
+        self.seed = 0
+        self.start = 0
+
+        self.entries: list[list[int]] = [[] for _ in buckets]
+
+        for index, name in enumerate(dataset.list()):
+            entry = dataset.get(name)
+            aspect_ratio = default_aspect_ratio if entry.width == None or entry.height == None else entry.width / entry.height
+
+            self.entries[nearest_bucket(buckets, aspect_ratio)].append(index)
+
+    # Set the shuffle seed of the next epoch and the amount of batches it skips.
+    def resume(self, seed: int, batches: int, batch_size: int):
+        self.seed = seed
+        self.start = batches
+
+    # Create the batches of an epoch for every process, the last batch of a bucket can be smaller.
+    def create_batches(self):
+        generator = random.Random(self.seed)
+        batches = []
+
+        for indices in self.entries:
+            indices = indices.copy()
+            generator.shuffle(indices)
+
+            batches += [indices[index:index + self.batch_size] for index in range(0, len(indices), self.batch_size)]
+
+        generator.shuffle(batches)
+
+        if len(batches) % self.world_size != 0:
+            batches += batches[:self.world_size - (len(batches) % self.world_size)]
+
+        return batches[self.rank::self.world_size]
+
+    # Get the amount of batches the current process has left in the epoch, the skipped batches are not counted.
+    def __len__(self):
+        amount = sum((len(indices) + self.batch_size - 1) // self.batch_size for indices in self.entries)
+
+        return max(0, ((amount + self.world_size - 1) // self.world_size) - self.start)
+
+    # Iterate through the batches of the current process.
+    def __iter__(self):
+        return iter(self.create_batches()[self.start:])
@@ -0,0 +1,123 @@
+from typing import Union
+from pathlib import Path
+import torchvision
+import numpy
+import torch
+import json
+import os
+
+from dekun.core.pipeline import run_pipeline
+from dekun.core.dataset import Dataset, Entry
+from dekun.core.utils import fit_tensor
+
+# A cache of the fitted dataset tensors, stored in a memory-mapped file.
+class TensorCache:
+
+    # Initialize a tensor cache.
+    def __init__(self, dataset: Dataset, width: int, height: int):
+        if width < 1:
+            raise ValueError(f"Invalid width: {width}")
+        if height < 1:
+            raise ValueError(f"Invalid height: {height}")
+
+        self.dataset = dataset
+        self.width = width
+        self.height = height
+
+        self.directory = dataset.directory.joinpath(".cache")
+        self.data_path = self.directory.joinpath(f"{width}x{height}.bin")
+        self.index_path = self.directory.joinpath(f"{width}x{height}.json")
+
+        self.slots = 0
+        self.entries = {}
+        self.memory: Union[numpy.memmap, None] = None
+
+        if self.index_path.exists():
+            index = json.loads(self.index_path.read_text())
+
+            if self.data_path.exists() and self.data_path.stat().st_size == index["slots"] * self.record_size():
+                self.slots = index["slots"]
+                self.entries = index["entries"]
+
+    # Get the size of a record in bytes.
+    def record_size(self):
+        return 4 * self.width * self.height
+
+    # Update the cache, only the entries that are new or changed are rebuilt, the mtimes come from the dataset manifest so the files are not checked again.
+    def update(self, workers: int = 4):
+        entries = {}
+        outdated = []
+
+        for name in self.dataset.list():
+            entry = self.dataset.get(name)
+            image_mtime = entry.image_mtime
+            mask_mtime = entry.mask_mtime
+
+            if name in self.entries and self.entries[name]["image_mtime"] == image_mtime and self.entries[name]["mask_mtime"] == mask_mtime:
+                entries[name] = self.entries[name]
+            else:
+                entries[name] = {"slot": -1, "image_mtime": image_mtime, "mask_mtime": mask_mtime}
+                outdated.append(entry)
+
+        used_slots = set(info["slot"] for info in entries.values() if info["slot"] >= 0)
+        free_slots = [slot for slot in range(self.slots) if slot not in used_slots]
+
+        for entry in outdated:
+            entries[entry.name]["slot"] = free_slots.pop(0) if len(free_slots) > 0 else self.slots
+            self.slots = max(self.slots, entries[entry.name]["slot"] + 1)
+
+        self.directory.mkdir(exist_ok=True)
+        self.memory = None
+
+        with open(self.data_path, "ab") as file:
+            file.truncate(self.slots * self.record_size())
+
+        if len(outdated) > 0:
+            memory = numpy.memmap(self.data_path, numpy.uint8, "r+", shape=(self.slots, self.record_size()))
+
+            # Decode and fit an entry.
+            def decode(entry: Entry):
+                image_tensor = fit_tensor(torchvision.io.decode_image(str(entry.image_path), torchvision.io.ImageReadMode.RGB), self.width, self.height)[0]
+                mask_tensor = fit_tensor(torchvision.io.decode_image(str(entry.mask_path), torchvision.io.ImageReadMode.GRAY), self.width, self.height)[0]
+
+                return torch.cat((image_tensor, mask_tensor), dim=0)
+
+            # Write an entry into its slot.
+            def write(entry: Entry, tensor: torch.Tensor):
+                memory[entries[entry.name]["slot"]] = tensor.flatten().numpy()
+
+            run_pipeline(outdated, decode, lambda tensors: tensors, write, workers, workers)
+
+            memory.flush()
+            del memory
+
+        self.entries = entries
+
+        temporary_path = self.index_path.with_suffix(".tmp")
+        temporary_path.write_text(json.dumps({"width": self.width, "height": self.height, "slots": self.slots, "entries": self.entries}))
+        os.replace(temporary_path, self.index_path)
+
+        return len(outdated)
+
+    # Check if an entry is cached.
+    def has(self, name: str):
+        return name in self.entries
+
+    # Get the cached image and mask tensors of an entry.
+    def get(self, name: str):
+        if name not in self.entries:
+            raise Exception(f"Entry not cached: {name}")
+
+        if self.memory is None:
+            self.memory = numpy.memmap(self.data_path, numpy.uint8, "c", shape=(self.slots, self.record_size()))
+
+        record = torch.from_numpy(self.memory[self.entries[name]["slot"]]).view(4, self.height, self.width)
+
+        return record[0:3], record[3:4]
+
+    # Drop the memory map when the cache is sent to another process.
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["memory"] = None
+
+        return state
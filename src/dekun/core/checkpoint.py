@@ -0,0 +1,102 @@
+from typing import Callable, Union
+from collections import OrderedDict
+from pathlib import Path
+from zipfile import ZipFile
+from time import time
+import pickle
+import shutil
+import os
+
+# A placeholder for the objects in a checkpoint that need torch to be restored.
+class Placeholder:
+
+    # Initialize a placeholder.
+    def __init__(self, *_, **__):
+        pass
+
+    # Ignore the state of the object.
+    def __setstate__(self, _):
+        pass
+
+# An unpickler that restores a checkpoint without torch, all the tensors are replaced with placeholders.
+class MetadataUnpickler(pickle.Unpickler):
+
+    # Find a class.
+    def find_class(self, module: str, name: str):
+        if module == "collections" and name == "OrderedDict":
+            return OrderedDict
+        if module == "builtins" and name in ["set", "frozenset", "slice", "complex"]:
+            return super().find_class(module, name)
+
+        return Placeholder
+
+    # Skip the storages.
+    def persistent_load(self, _):
+        return None
+
+# Load the metadata of a checkpoint (the values that are not tensors) without importing torch.
+def load_metadata(path: Path) -> dict:
+    with ZipFile(path) as archive:
+        name = next((name for name in archive.namelist() if name.endswith("/data.pkl")), None)
+
+        if name == None:
+            raise Exception(f"Unsupported checkpoint: {str(path)}")
+
+        with archive.open(name) as file:
+            data = MetadataUnpickler(file).load()
+
+    if not isinstance(data, dict):
+        raise Exception(f"Unsupported checkpoint: {str(path)}")
+
+    return {key: value for key, value in data.items() if not isinstance(value, (dict, Placeholder))}
+
+# A checkpointer that saves a checkpoint every N steps or seconds, the previous checkpoints are kept next to it (<name>.1<suffix> is the newest).
+class Checkpointer:
+
+    # Initialize a checkpointer.
+    def __init__(self, path: Path, steps: Union[int, None] = None, interval: Union[float, None] = None, keep: int = 1):
+        if steps != None and steps < 1:
+            raise ValueError(f"Invalid checkpoint steps: {steps}")
+        if interval != None and interval <= 0:
+            raise ValueError(f"Invalid checkpoint interval: {interval}")
+        if keep < 1:
+            raise ValueError(f"Invalid checkpoint amount: {keep}")
+
+        self.path = path
+        self.steps = steps
+        self.interval = interval
+        self.keep = keep
+
+        self.last = time()
+
+    # Check if a checkpoint is due after a step.
+    def due(self, step: int):
+        return (self.steps != None and step % self.steps == 0) or (self.interval != None and time() - self.last >= self.interval)
+
+    # Get the path of a previous checkpoint.
+    def history_path(self, index: int):
+        return self.path.with_name(f"{self.path.stem}.{index}{self.path.suffix}")
+
+    # Save a checkpoint, the save function is expected to replace the file atomically.
+    def save(self, save: Callable[[Path], None]):
+        self.rotate()
+
+        save(self.path)
+
+        self.last = time()
+
+    # Shift the previous checkpoints and keep the current one, the oldest one is dropped.
+    def rotate(self):
+        if self.keep < 2 or not self.path.exists():
+            return
+
+        for index in range(self.keep - 1, 1, -1):
+            if self.history_path(index - 1).exists():
+                os.replace(self.history_path(index - 1), self.history_path(index))
+
+        self.history_path(1).unlink(missing_ok=True)
+
+        try:
+            os.link(self.path, self.history_path(1))
+        except OSError:
+            shutil.copyfile(self.path, self.history_path(1))
@@ -1,5 +1,10 @@
+from bisect import bisect_left, insort
 from typing import Union, cast
 from pathlib import Path
+import json
+import os
+
+from dekun.core.image import read_image_size
 
 # An entry info.
 class Info:
@@ -27,10 +32,37 @@ class Dataset():
             raise Exception(f"The path does not exists: {str(self.directory)}")
         if not self.directory.is_dir():
             raise Exception(f"The path is not a directory: {str(self.directory)}")
+        if self.sort not in ["name", "date", "size"]:
+            raise ValueError(f"Unsupported sort type: {self.sort} (name|date|size)")
 
         self.entry_map = {}
         self.entry_list = []
+        self.page_map = {}
+
+        self.manifest_path = self.directory.joinpath(".manifest.jsonl")
+
+        records, directory_mtime, lines = self.read_manifest()
+        stale = directory_mtime != self.directory.stat().st_mtime_ns
+
+        if stale:
+            self.scan(records)
+        else:
+            for record in records.values():
+                entry = Entry.restore(record, self)
+
+                self.entry_map[entry.name] = entry
+
+        for id, entry in self.entry_map.items():
+            self.entry_list.append(id)
+            self.index(entry)
+
+        self.entry_list.sort(key=self.sort_key)
+
+        if stale or lines > (len(self.entry_list) * 2) + 64:
+            self.write_manifest()
 
+    # Scan the directory, the dimensions of the unchanged images are taken from the manifest records.
+    def scan(self, records: dict[str, dict]):
         for path in self.directory.iterdir():
             parts = path.stem.split("-")
             
@@ -52,17 +84,109 @@ class Dataset():
             if entry.image_path == None or entry.mask_path == None:
                 raise Exception(f"Incomplete dataset entry: {id}")
 
-            self.entry_list.append(id)
+            entry.load_stat()
+
+            record = records.get(id)
+
+            if record != None and record["image"] == entry.image_path.name and record["image_mtime"] == entry.image_mtime and record["image_size"] == entry.image_size:
+                entry.width = record["width"]
+                entry.height = record["height"]
+            else:
+                entry.load_dimensions()
+
+    # Read the manifest, the directory mtime is None when the manifest does not describe the current directory.
+    def read_manifest(self) -> tuple[dict[str, dict], Union[int, None], int]:
+        records = {}
+        directory_mtime = None
+        lines = 0
 
+        if not self.manifest_path.exists():
+            return records, None, 0
+
+        with open(self.manifest_path, "r") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    return records, None, lines
+
+                lines += 1
+
+                if record["type"] == "entry":
+                    records[record["name"]] = record
+                    directory_mtime = None
+                elif record["type"] == "remove":
+                    records.pop(record["name"], None)
+                    directory_mtime = None
+                elif record["type"] == "directory":
+                    directory_mtime = record["mtime"]
+
+        return records, directory_mtime, lines
+
+    # Write the whole manifest, the manifest is only an optimization so it is skipped when the directory is read-only.
+    def write_manifest(self):
+        temporary_path = self.manifest_path.with_suffix(".tmp")
+
+        try:
+            with open(temporary_path, "w") as file:
+                for name in self.entry_list:
+                    file.write(json.dumps(self.entry_map[name].to_record()) + "\n")
+
+            os.replace(temporary_path, self.manifest_path)
+
+            self.append_manifest([])
+        except OSError:
+            pass
+
+    # Append records to the manifest, followed by the current directory mtime.
+    def append_manifest(self, records: list[dict]):
+        try:
+            with open(self.manifest_path, "a") as file:
+                for record in records:
+                    file.write(json.dumps(record) + "\n")
+
+                file.write(json.dumps({"type": "directory", "mtime": self.directory.stat().st_mtime_ns}) + "\n")
+        except OSError:
+            pass
+
+    # Get the sort key of an entry, the newest and the largest entries come first.
+    def sort_key(self, name: str):
         if self.sort == "name":
-            self.entry_list = sorted(self.entry_list)
+            return name
         elif self.sort == "date":
-            self.entry_list.sort(key=lambda name: -self.entry_map[name].image_path.stat().st_ctime)
+            return -self.entry_map[name].get_ctime()
         elif self.sort == "size":
-            self.entry_list.sort(key=lambda name: -self.entry_map[name].image_path.stat().st_size)
+            return -self.entry_map[name].get_size()
         else:
             raise ValueError(f"Unsupported sort type: {self.sort} (name|date|size)")
 
+    # Add an entry to the page index.
+    def index(self, entry: "Entry"):
+        key = (entry.info.provider, entry.info.id, entry.info.page)
+
+        if key not in self.page_map:
+            self.page_map[key] = {}
+
+        self.page_map[key][entry.name] = entry
+
+    # Remove an entry from the page index.
+    def unindex(self, entry: "Entry"):
+        key = (entry.info.provider, entry.info.id, entry.info.page)
+
+        if key in self.page_map:
+            self.page_map[key].pop(entry.name, None)
+
+            if len(self.page_map[key]) == 0:
+                del self.page_map[key]
+
+    # Find the entries of a page.
+    def find(self, provider: str, id: str, page: str) -> list["Entry"]:
+        return list(self.page_map.get((provider, id, page), {}).values())
+
+    # Check if a page has any entry.
+    def has_page(self, provider: str, id: str, page: str):
+        return (provider, id, page) in self.page_map
+
     # Check if an entry exists.
     def has(self, name: str):
         return name in self.entry_map
@@ -86,27 +210,37 @@ class Dataset():
     def add(self, info: Info, image_path: Path, mask_path: Path):
         id = f"{info.provider}-{info.id}-{info.page}-{info.author}"
 
-        if id not in self.entry_map:
-            self.entry_list.append(id)
+        if id in self.entry_map:
+            self.remove(id)
 
-        self.entry_map[id] = Entry(info, self, image_path, mask_path)
+        entry = Entry(info, self, image_path, mask_path)
+        entry.load_stat()
+        entry.load_dimensions()
 
-        if self.sort == "name":
-            self.entry_list = sorted(self.entry_list)
-        elif self.sort == "date":
-            self.entry_list.sort(key=lambda name: -self.entry_map[name].image_path.stat().st_ctime)
-        elif self.sort == "size":
-            self.entry_list.sort(key=lambda name: -self.entry_map[name].image_path.stat().st_size)
-        else:
-            raise ValueError(f"Unsupported sort type: {self.sort} (name|date|size)")
+        self.entry_map[id] = entry
+        self.index(entry)
+
+        insort(self.entry_list, id, key=self.sort_key)
+
+        self.append_manifest([entry.to_record()])
 
     # Remove an entry.
     def remove(self, name: str):
         if (name not in self.entry_map):
             raise Exception(f"Entry not found: {name}") 
 
+        self.unindex(self.entry_map[name])
+
+        key = self.sort_key(name)
+        index = bisect_left(self.entry_list, key, key=self.sort_key)
+
+        while self.entry_list[index] != name:
+            index += 1
+
+        del self.entry_list[index]
         del self.entry_map[name]
-        self.entry_list.remove(name)
+
+        self.append_manifest([{"type": "remove", "name": name}])
 
 # A dataset entry.
 class Entry:
@@ -115,14 +249,89 @@ class Entry:
     def __init__(self, info: Info, dataset: Dataset, image_path: Union[Path, None] = None, mask_path: Union[Path, None] = None):
         self.info = info
         self.dataset = dataset
+        self.name = f"{info.provider}-{info.id}-{info.page}-{info.author}"
 
         self.image_path = image_path
         self.mask_path = mask_path
 
+        self.image_ctime: Union[float, None] = None
+        self.image_size: Union[int, None] = None
+        self.image_mtime: Union[int, None] = None
+        self.mask_mtime: Union[int, None] = None
+        self.mask_size: Union[int, None] = None
+
+        self.width: Union[int, None] = None
+        self.height: Union[int, None] = None
+
+    # Restore an entry from a manifest record.
+    @staticmethod
+    def restore(record: dict, dataset: Dataset):
+        parts = record["name"].split("-")
+        entry = Entry(Info(parts[0], parts[1], parts[2], parts[3]), dataset, dataset.directory.joinpath(record["image"]), dataset.directory.joinpath(record["mask"]))
+
+        entry.image_ctime = record["image_ctime"]
+        entry.image_size = record["image_size"]
+        entry.image_mtime = record["image_mtime"]
+        entry.mask_mtime = record["mask_mtime"]
+        entry.mask_size = record["mask_size"]
+
+        entry.width = record["width"]
+        entry.height = record["height"]
+
+        return entry
+
+    # Get the manifest record of the entry.
+    def to_record(self):
+        return {
+            "type": "entry",
+            "name": self.name,
+            "image": cast(Path, self.image_path).name,
+            "mask": cast(Path, self.mask_path).name,
+            "image_ctime": self.get_ctime(),
+            "image_size": self.get_size(),
+            "image_mtime": self.image_mtime,
+            "mask_mtime": self.mask_mtime,
+            "mask_size": self.mask_size,
+            "width": self.width,
+            "height": self.height
+        }
+
+    # Load the times and the sizes of the image and the mask.
+    def load_stat(self):
+        image_stat = cast(Path, self.image_path).stat()
+        mask_stat = cast(Path, self.mask_path).stat()
+
+        self.image_ctime = image_stat.st_ctime
+        self.image_size = image_stat.st_size
+        self.image_mtime = image_stat.st_mtime_ns
+        self.mask_mtime = mask_stat.st_mtime_ns
+        self.mask_size = mask_stat.st_size
+
+    # Load the dimensions of the image from its header.
+    def load_dimensions(self):
+        size = read_image_size(cast(Path, self.image_path))
+
+        if size != None:
+            self.width, self.height = size
+
+    # Get the creation time of the image, the value is cached.
+    def get_ctime(self) -> float:
+        if self.image_ctime == None:
+            self.load_stat()
+
+        return cast(float, self.image_ctime)
+
+    # Get the size of the image, the value is cached.
+    def get_size(self) -> int:
+        if self.image_size == None:
+            self.load_stat()
+
+        return cast(int, self.image_size)
+
     # Check if the entry exists.
     def exists(self):
         return cast(Path, self.image_path).exists() and cast(Path, self.mask_path).exists()
 
     # Remove the entry.
     def remove(self):
-        self.dataset.remove(f"{self.info.provider}-{self.info.id}-{self.info.page}-{self.info.author}")
+        self.dataset.remove(self.name)
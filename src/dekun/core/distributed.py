@@ -0,0 +1,139 @@
+from contextlib import nullcontext
+from typing import Iterable
+import torch.distributed as dist
+import torch
+import os
+
+# Check if the process is launched as a part of a distributed training (by torchrun).
+def is_distributed():
+    return int(os.environ.get("WORLD_SIZE", "1")) > 1
+
+# Initialize the process group, the gloo backend is used on CPU and NCCL on CUDA.
+def init_distributed(device: str):
+    if not is_distributed() or dist.is_initialized():
+        return
+
+    if device != "cpu" and torch.cuda.is_available():
+        torch.cuda.set_device(int(os.environ.get("LOCAL_RANK", "0")))
+
+        dist.init_process_group("nccl")
+    else:
+        dist.init_process_group("gloo")
+
+# Destroy the process group.
+def cleanup_distributed():
+    if dist.is_initialized():
+        dist.destroy_process_group()
+
+# Get the rank of the process.
+def get_rank():
+    return dist.get_rank() if dist.is_initialized() else 0
+
+# Get the amount of processes.
+def get_world_size():
+    return dist.get_world_size() if dist.is_initialized() else 1
+
+# Get the amount of processes on this node.
+def get_local_world_size():
+    return int(os.environ.get("LOCAL_WORLD_SIZE", "1")) if dist.is_initialized() else 1
+
+# Check if the process is the main process, only the main process prints and saves.
+def is_main_process():
+    return get_rank() == 0
+
+# Wait for every process.
+def barrier():
+    if dist.is_initialized():
+        dist.barrier()
+
+# Sum a list of values across the processes.
+def all_reduce_sum(values: list[float], device: torch.device):
+    if not dist.is_initialized():
+        return values
+
+    tensor = torch.tensor(values, dtype=torch.float64, device=device)
+    dist.all_reduce(tensor)
+
+    return tensor.tolist()
+
+# Average the gradients of a module across the processes, used for modules that run more than once per step.
+def all_reduce_gradients(module: torch.nn.Module):
+    if not dist.is_initialized():
+        return
+
+    gradients = [parameter.grad for parameter in module.parameters() if parameter.grad is not None]
+
+    if len(gradients) == 0:
+        return
+
+    flat = torch.cat([gradient.flatten() for gradient in gradients])
+    dist.all_reduce(flat)
+    flat /= get_world_size()
+
+    offset = 0
+
+    for gradient in gradients:
+        gradient.copy_(flat[offset:offset + gradient.numel()].view_as(gradient))
+        offset += gradient.numel()
+
+# Copy the parameters and the buffers of a module from the main process.
+def broadcast_module(module: torch.nn.Module):
+    if not dist.is_initialized():
+        return
+
+    for tensor in module.state_dict().values():
+        dist.broadcast(tensor, 0)
+
+# Seed every process with the same seed from the main process, so the shared shuffles match.
+def seed_distributed(device: torch.device):
+    if not dist.is_initialized():
+        return
+
+    tensor = torch.randint(0, 2 ** 62, (1,), dtype=torch.int64).to(device)
+    dist.broadcast(tensor, 0)
+
+    torch.manual_seed(int(tensor.item()))
+
+# Iterate through the batches until any process runs out of batches, so every process runs the same amount of steps.
+def even_batches(batches: Iterable, device: torch.device):
+    if not dist.is_initialized():
+        yield from batches
+
+        return
+
+    iterator = iter(batches)
+
+    while True:
+        batch = next(iterator, None)
+
+        tensor = torch.tensor([0 if batch is None else 1], dtype=torch.int64, device=device)
+        dist.all_reduce(tensor, dist.ReduceOp.MIN)
+
+        if tensor.item() == 0:
+            break
+
+        yield batch
+
+# Broadcast a flag from the main process, so every process makes the same decision.
+def broadcast_flag(flag: bool, device: torch.device):
+    if not dist.is_initialized():
+        return flag
+
+    tensor = torch.tensor([1 if flag else 0], dtype=torch.int64, device=device)
+    dist.broadcast(tensor, 0)
+
+    return bool(tensor.item())
+
+# Skip the gradient synchronization of a wrapped model until the last accumulation step.
+def accumulate_gradients(model: torch.nn.Module, sync: bool):
+    if isinstance(model, torch.nn.parallel.DistributedDataParallel) and not sync:
+        return model.no_sync()
+
+    return nullcontext()
+
+# Wrap a model for distributed training, the model is returned as it is when the process is not distributed.
+def wrap_model(model: torch.nn.Module, device: torch.device) -> torch.nn.Module:
+    if not dist.is_initialized():
+        return model
+
+    return torch.nn.parallel.DistributedDataParallel(model, device_ids=[device.index if device.index != None else torch.cuda.current_device()] if device.type == "cuda" else None)
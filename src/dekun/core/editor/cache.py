@@ -0,0 +1,269 @@
+from starlette.responses import StreamingResponse
+from collections import OrderedDict
+from tempfile import mkstemp
+from threading import RLock
+from typing import BinaryIO, Union
+from hashlib import sha1
+from pathlib import Path
+from time import time
+import httpx
+import json
+import os
+
+# An on-disk cache of the upstream resources, the least recently used resources are evicted once the cache is over its size.
+class ResourceCache:
+
+    # Initialize a resource cache.
+    def __init__(self, directory: Path, max_size: int, max_age: float = 86400):
+        if max_size < 0:
+            raise ValueError(f"Invalid max size: {max_size}")
+        if max_age < 0:
+            raise ValueError(f"Invalid max age: {max_age}")
+
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age
+
+        self.size = 0
+        self.entries: dict[str, dict] = {}
+        self.lock = RLock()
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        for path in self.directory.glob("*.json"):
+            data_path = path.with_suffix(".bin")
+
+            try:
+                info = json.loads(path.read_text())
+                stat = data_path.stat()
+            except (OSError, ValueError):
+                path.unlink(missing_ok=True)
+                data_path.unlink(missing_ok=True)
+
+                continue
+
+            if stat.st_size != info["size"]:
+                path.unlink(missing_ok=True)
+                data_path.unlink(missing_ok=True)
+
+                continue
+
+            info["used"] = stat.st_mtime
+            self.entries[path.stem] = info
+            self.size += info["size"]
+
+        for path in self.directory.glob(".*.tmp"):
+            path.unlink(missing_ok=True)
+
+        self.evict()
+
+    # Get the name of the files of a resource.
+    def name(self, key: str):
+        return sha1(key.encode()).hexdigest()
+
+    # Get the info of a cached resource.
+    def get(self, key: str) -> Union[dict, None]:
+        return self.entries.get(self.name(key))
+
+    # Check if a cached resource can be used without revalidation.
+    def is_fresh(self, info: dict):
+        return time() - info["checked"] < self.max_age
+
+    # Get the headers to revalidate a cached resource.
+    def validators(self, info: dict):
+        headers = {}
+
+        if info["etag"] != None:
+            headers["If-None-Match"] = info["etag"]
+        if info["last_modified"] != None:
+            headers["If-Modified-Since"] = info["last_modified"]
+
+        return headers
+
+    # Mark a cached resource as revalidated.
+    def revalidate(self, key: str):
+        name = self.name(key)
+
+        with self.lock:
+            if name in self.entries:
+                self.entries[name]["checked"] = time()
+                self.write_info(name)
+
+    # Respond with a cached resource, the file is opened while the cache is locked so an eviction cannot remove it before it is sent, nothing is returned when the resource is no longer cached.
+    def respond(self, key: str, extra_headers: Union[dict[str, str], None] = None):
+        name = self.name(key)
+
+        with self.lock:
+            info = self.entries.get(name)
+
+            if info == None:
+                return None
+
+            data_path = self.directory.joinpath(f"{name}.bin")
+
+            try:
+                file = open(data_path, "rb")
+            except FileNotFoundError:
+                return None
+
+            info["used"] = time()
+            os.utime(file.fileno(), (info["used"], info["used"]))
+
+        headers = {} if extra_headers is None else dict(extra_headers)
+        headers["Content-Length"] = str(os.fstat(file.fileno()).st_size)
+
+        if info["content_encoding"] != None:
+            headers["Content-Encoding"] = info["content_encoding"]
+
+        return StreamingResponse(read_file(file), 200, headers=headers, media_type=info["content_type"])
+
+    # Create a writer for an upstream response, no writer is created when the response cannot be cached.
+    def writer(self, key: str, response: httpx.Response):
+        if response.status_code != 200 or int(response.headers.get("Content-Length", 0)) > self.max_size:
+            return None
+
+        return ResourceWriter(self, key, {
+            "key": key,
+            "content_type": response.headers.get("Content-Type", "application/octet-stream"),
+            "content_encoding": response.headers.get("Content-Encoding"),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "size": 0,
+            "checked": time()
+        })
+
+    # Store a written resource.
+    def store(self, key: str, temporary_path: Path, info: dict):
+        name = self.name(key)
+
+        with self.lock:
+            if name in self.entries:
+                self.size -= self.entries[name]["size"]
+
+            os.replace(temporary_path, self.directory.joinpath(f"{name}.bin"))
+
+            info["used"] = time()
+            self.entries[name] = info
+            self.size += info["size"]
+            self.write_info(name)
+
+            self.evict()
+
+    # Write the info of a cached resource.
+    def write_info(self, name: str):
+        info = {key: value for key, value in self.entries[name].items() if key != "used"}
+        temporary_path = self.directory.joinpath(f".{name}.json.tmp")
+
+        temporary_path.write_text(json.dumps(info))
+        os.replace(temporary_path, self.directory.joinpath(f"{name}.json"))
+
+    # Evict the least recently used resources until the cache fits its size.
+    def evict(self):
+        with self.lock:
+            if self.size <= self.max_size:
+                return
+
+            for name in sorted(self.entries, key=lambda name: self.entries[name]["used"]):
+                if self.size <= self.max_size:
+                    break
+
+                self.directory.joinpath(f"{name}.json").unlink(missing_ok=True)
+                self.directory.joinpath(f"{name}.bin").unlink(missing_ok=True)
+
+                self.size -= self.entries[name]["size"]
+                del self.entries[name]
+
+# Read an opened file in chunks, the file is closed once it is read.
+def read_file(file: BinaryIO, chunk_size: int = 65536):
+    with file:
+        while True:
+            chunk = file.read(chunk_size)
+
+            if not chunk:
+                break
+
+            yield chunk
+
+# A writer that stores a resource into the cache while it is streamed.
+class ResourceWriter:
+
+    # Initialize a resource writer.
+    def __init__(self, cache: ResourceCache, key: str, info: dict):
+        self.cache = cache
+        self.key = key
+        self.info = info
+
+        descriptor, path = mkstemp(".tmp", ".", cache.directory)
+
+        self.file = os.fdopen(descriptor, "wb")
+        self.temporary_path = Path(path)
+
+    # Write a chunk of the resource, the writer is aborted once the resource is over the size of the cache.
+    def write(self, chunk: bytes):
+        if self.file is None:
+            return
+
+        self.file.write(chunk)
+        self.info["size"] += len(chunk)
+
+        if self.info["size"] > self.cache.max_size:
+            self.abort()
+
+    # Store the resource into the cache.
+    def commit(self):
+        if self.file is None:
+            return
+
+        self.file.close()
+        self.file = None
+
+        self.cache.store(self.key, self.temporary_path, self.info)
+
+    # Discard the resource, nothing happens if the resource is already stored.
+    def abort(self):
+        if self.file is None:
+            return
+
+        self.file.close()
+        self.file = None
+
+        self.temporary_path.unlink(missing_ok=True)
+
+# An in-memory cache that keeps the responses for a short time.
+class MemoryCache:
+
+    # Initialize a memory cache.
+    def __init__(self, ttl: float = 300, max_entries: int = 256):
+        if ttl < 0:
+            raise ValueError(f"Invalid TTL: {ttl}")
+        if max_entries < 1:
+            raise ValueError(f"Invalid max entries: {max_entries}")
+
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self.entries: OrderedDict[str, tuple[float, bytes, Union[str, None]]] = OrderedDict()
+
+    # Get a cached response (content, content type).
+    def get(self, key: str):
+        if key not in self.entries:
+            return None
+
+        expires, content, content_type = self.entries[key]
+
+        if time() >= expires:
+            del self.entries[key]
+
+            return None
+
+        self.entries.move_to_end(key)
+
+        return content, content_type
+
+    # Cache a response.
+    def set(self, key: str, content: bytes, content_type: Union[str, None]):
+        self.entries[key] = (time() + self.ttl, content, content_type)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
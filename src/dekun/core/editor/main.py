@@ -1,28 +1,43 @@
 from starlette.responses import Response, PlainTextResponse, JSONResponse, FileResponse
 from starlette.staticfiles import StaticFiles
 from starlette.applications import Starlette
-from requests import request as send_request
 from starlette.requests import Request
 from starlette.routing import Mount
 from hypercorn.config import Config
 from hypercorn.asyncio import serve
+from contextlib import asynccontextmanager
 from base64 import b64decode
 from threading import Timer
+from typing import Union
 from pathlib import Path
-from typing import cast
+from httpx import HTTPError
 import asyncio
 import uvloop
 import gc
 
 from dekun.core.dataset import Dataset, Info
+from dekun.core.editor.cache import MemoryCache, ResourceCache
+from dekun.core.editor.proxy import Proxy
 
 # Start the editor.
-def start_editor(port: int, dataset_path: Path):
+def start_editor(port: int, dataset_path: Path, cache_directory: Union[Path, None] = None, cache_size: int = 1024 * 1024 * 1024):
     static_directory = Path(__file__).parent.joinpath("static")
 
+    proxy = Proxy()
+    resource_cache = ResourceCache(dataset_path.joinpath(".cache", "resources") if cache_directory == None else cache_directory, cache_size)
+    metadata_cache = MemoryCache(300)
+
+    @asynccontextmanager
+    async def lifespan(_: Starlette):
+        proxy.start()
+
+        yield
+
+        await proxy.close()
+
     app = Starlette(routes = [
          Mount('/assets', app = StaticFiles(directory = static_directory.joinpath("assets")), name = "assets")
-    ])
+    ], lifespan = lifespan)
 
     dataset = Dataset(dataset_path, "date")
 
@@ -32,13 +47,16 @@ def start_editor(port: int, dataset_path: Path):
 
     @app.route("/api/check/{provider}/{id}/{page}")
     async def check(request: Request):
-        parts = [request.path_params["provider"], request.path_params["id"], request.path_params["page"]]
+        return JSONResponse(dataset.has_page(request.path_params["provider"], request.path_params["id"], request.path_params["page"]), 200)
 
-        for entry in dataset.list():
-            if entry.split("-")[0:3] == parts:
-                return JSONResponse(True, 200)
+    @app.route("/api/check", methods=["POST"])
+    async def check_bulk(request: Request):
+        try:
+            data = await request.json()
 
-        return JSONResponse(False, 200)
+            return JSONResponse([dataset.has_page(str(page["provider"]), str(page["id"]), str(page["page"])) for page in data], 200)
+        except (KeyError, TypeError, ValueError):
+            return PlainTextResponse("Bad Request", 400)
 
     @app.route("/api/submit", methods=["PUT"])
     async def submit(request: Request):
@@ -76,42 +94,35 @@ def start_editor(port: int, dataset_path: Path):
 
     @app.route("/api/drivers/pixiv/discovery")
     async def pixiv_discovery(_: Request):
-        response = send_request("GET", "https://www.pixiv.net/ajax/illust/discovery?mode=all")
-
-        return Response(response.text, response.status_code, media_type=response.headers.get("Content-Type"))
+        return await proxy.forward("https://www.pixiv.net/ajax/illust/discovery?mode=all")
 
     @app.route("/api/drivers/pixiv/pages/{id}")
     async def pixiv_pages(request: Request): 
-        response = send_request("GET", f"https://www.pixiv.net/ajax/illust/{request.path_params['id']}/pages")
-
-        return Response(response.text, response.status_code, media_type=response.headers.get("Content-Type"))
+        return await proxy.forward(f"https://www.pixiv.net/ajax/illust/{request.path_params['id']}/pages", metadata_cache)
 
     @app.route("/api/drivers/nhentai/latest")
     async def nHentai_latest(_: Request):
-        response = send_request("GET", "https://api.nhentai.zip/latest")
-
-        return Response(response.text, response.status_code, media_type=response.headers.get("Content-Type"))
+        return await proxy.forward("https://api.nhentai.zip/latest")
 
     @app.route("/api/drivers/nhentai/pages/{id}")
     async def nHentai_pages(request: Request):
-        response = send_request("GET", f"https://api.nhentai.zip/pages/{request.path_params['id']}")
-
-        return Response(response.text, response.status_code, media_type=response.headers.get("Content-Type"))
+        return await proxy.forward(f"https://api.nhentai.zip/pages/{request.path_params['id']}", metadata_cache)
 
     @app.route("/api/drivers/danbooru/random")
     async def danbooru_random(request: Request):
-        response = send_request("GET", "https://danbooru.donmai.us/posts/random")
+        try:
+            response = await proxy.fetch("https://danbooru.donmai.us/posts/random")
+        except HTTPError as error:
+            return PlainTextResponse(f"Bad Gateway: {type(error).__name__}", 502)
 
         if response.status_code == 200:
-            return Response(response.url.split("/")[4], 200, media_type = "text/plain")
+            return Response(str(response.url).split("/")[4], 200, media_type = "text/plain")
 
-        return Response(response.text, response.status_code, media_type=response.headers.get("Content-Type"))
+        return Response(response.content, response.status_code, media_type=response.headers.get("Content-Type"))
 
     @app.route("/api/drivers/danbooru/post/{id}")
     async def danbooru_post(request: Request):
-        response = send_request("GET", f"https://danbooru.donmai.us/posts/{request.path_params['id']}.json")
-
-        return Response(response.text, response.status_code, media_type=response.headers.get("Content-Type"))
+        return await proxy.forward(f"https://danbooru.donmai.us/posts/{request.path_params['id']}.json", metadata_cache)
 
     @app.route("/resource/image/{name}")
     async def image(request: Request):
@@ -137,32 +148,23 @@ def start_editor(port: int, dataset_path: Path):
 
     @app.route("/resource/pixiv/{id}/{page}")
     async def pixiv_image(request: Request):
-        response = send_request("GET", f"https://i.pixiv.cat/img-original/img/{request.path_params['id'].replace('-', '/')}/{request.path_params['page']}") 
-
-        return Response(response.content, response.status_code, headers = {
-            "Content-Type": cast(str, response.headers.get("Content-Type")),
+        return await proxy.stream(f"https://i.pixiv.cat/img-original/img/{request.path_params['id'].replace('-', '/')}/{request.path_params['page']}", {
             "Cache-Control": "max-age=86400"
-        })
+        }, resource_cache, f"pixiv/{request.path_params['id']}/{request.path_params['page']}")
 
     @app.route("/resource/nhentai/{id}/{page}")
     async def nHentai_image(request: Request):
-        response = send_request("GET", f"https://i.nhentai.zip/galleries/{request.path_params['id']}/{request.path_params['page']}")
-
-        return Response(response.content, response.status_code, headers = {
-            "Content-Type": cast(str, response.headers.get("Content-Type")),
+        return await proxy.stream(f"https://i.nhentai.zip/galleries/{request.path_params['id']}/{request.path_params['page']}", {
             "Cache-Control": "max-age=86400"
-        })
+        }, resource_cache, f"nhentai/{request.path_params['id']}/{request.path_params['page']}")
 
     @app.route("/resource/danbooru/{id}")
     async def danbooru_image(request: Request):
         id = request.path_params['id']
 
-        response = send_request("GET", f"https://cdn.donmai.us/original/{id[0:2]}/{id[2:4]}/{id}")
-
-        return Response(response.content, response.status_code, headers = {
-            "Content-Type": cast(str, response.headers.get("Content-Type")),
+        return await proxy.stream(f"https://cdn.donmai.us/original/{id[0:2]}/{id[2:4]}/{id}", {
             "Cache-Control": "max-age=86400"
-        })
+        }, resource_cache, f"danbooru/{id}")
 
     config = Config()
     config.bind = [f"0.0.0.0:{str(port)}"]
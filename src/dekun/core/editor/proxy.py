@@ -0,0 +1,175 @@
+from starlette.responses import Response, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from typing import Awaitable, Callable, Union
+import asyncio
+import httpx
+
+from dekun.core.editor.cache import MemoryCache, ResourceCache, ResourceWriter
+
+# A proxy for the upstream sources, all the requests share a keep-alive connection pool.
+class Proxy:
+
+    # Initialize a proxy.
+    def __init__(self, max_connections: int = 32, max_host_connections: int = 8, timeout: float = 30.0, connect_timeout: float = 10.0):
+        if max_connections < 1:
+            raise ValueError(f"Invalid max connections: {max_connections}")
+        if max_host_connections < 1:
+            raise ValueError(f"Invalid max host connections: {max_host_connections}")
+
+        self.max_connections = max_connections
+        self.max_host_connections = max_host_connections
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+
+        self.client: Union[httpx.AsyncClient, None] = None
+        self.semaphores: dict[str, asyncio.Semaphore] = {}
+
+    # Start the proxy.
+    def start(self):
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+            timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+            follow_redirects=True
+        )
+
+    # Close the proxy.
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+
+            self.client = None
+
+    # Get the semaphore of a host.
+    def semaphore(self, url: str):
+        host = httpx.URL(url).host
+
+        if host not in self.semaphores:
+            self.semaphores[host] = asyncio.Semaphore(self.max_host_connections)
+
+        return self.semaphores[host]
+
+    # Get the client of the proxy.
+    def get_client(self):
+        if self.client is None:
+            raise Exception("The proxy is not started")
+
+        return self.client
+
+    # Fetch a resource, the whole body is read.
+    async def fetch(self, url: str, headers: Union[dict[str, str], None] = None):
+        async with self.semaphore(url):
+            return await self.get_client().get(url, headers=headers)
+
+    # Forward a resource, the body is read into the response and successful responses are kept in the cache.
+    async def forward(self, url: str, cache: Union[MemoryCache, None] = None):
+        if cache is not None:
+            cached = cache.get(url)
+
+            if cached is not None:
+                return Response(cached[0], 200, media_type=cached[1])
+
+        try:
+            response = await self.fetch(url)
+        except httpx.HTTPError as error:
+            return PlainTextResponse(f"Bad Gateway: {type(error).__name__}", 502)
+
+        if cache is not None and response.status_code == 200:
+            cache.set(url, response.content, response.headers.get("Content-Type"))
+
+        return Response(response.content, response.status_code, media_type=response.headers.get("Content-Type"))
+
+    # Open a resource without reading the body, the returned function must be called to release the connection.
+    async def open(self, url: str, headers: Union[dict[str, str], None] = None) -> tuple[httpx.Response, Callable[[], Awaitable[None]]]:
+        semaphore = self.semaphore(url)
+
+        await semaphore.acquire()
+
+        try:
+            response = await self.get_client().send(self.get_client().build_request("GET", url, headers=headers), stream=True)
+        except BaseException:
+            semaphore.release()
+
+            raise
+
+        released = False
+
+        # Close the upstream response and release the host.
+        async def release():
+            nonlocal released
+
+            if not released:
+                released = True
+
+                await response.aclose()
+                semaphore.release()
+
+        return response, release
+
+    # Respond with an opened resource, the body is sent to the client as it arrives.
+    def respond(self, response: httpx.Response, release: Callable[[], Awaitable[None]], extra_headers: Union[dict[str, str], None] = None, writer: Union[ResourceWriter, None] = None):
+
+        # Read the body and release the connection once it is done.
+        async def read():
+            try:
+                async for chunk in response.aiter_raw():
+                    if writer is not None:
+                        writer.write(chunk)
+
+                    yield chunk
+
+                if writer is not None:
+                    writer.commit()
+            finally:
+                if writer is not None:
+                    writer.abort()
+
+                await release()
+
+        response_headers = {"Content-Type": response.headers.get("Content-Type", "application/octet-stream")}
+
+        for name in ["Content-Length", "Content-Encoding"]:
+            if name in response.headers:
+                response_headers[name] = response.headers[name]
+
+        if extra_headers is not None:
+            response_headers.update(extra_headers)
+
+        return StreamingResponse(read(), response.status_code, headers=response_headers, background=BackgroundTask(release))
+
+    # Stream a resource, the body is sent to the client as it arrives and kept in the cache, a resource evicted while it is revalidated is fetched again.
+    async def stream(self, url: str, extra_headers: Union[dict[str, str], None] = None, cache: Union[ResourceCache, None] = None, key: Union[str, None] = None):
+        if key is None:
+            key = url
+
+        info = None if cache is None else cache.get(key)
+
+        if cache is not None and info is not None and cache.is_fresh(info):
+            cached = cache.respond(key, extra_headers)
+
+            if cached is not None:
+                return cached
+
+            info = None
+
+        try:
+            response, release = await self.open(url, None if cache is None or info is None else cache.validators(info))
+        except httpx.HTTPError as error:
+            cached = None if cache is None or info is None else cache.respond(key, extra_headers)
+
+            return PlainTextResponse(f"Bad Gateway: {type(error).__name__}", 502) if cached is None else cached
+
+        if cache is not None and info is not None and response.status_code == 304:
+            await release()
+            cache.revalidate(key)
+
+            cached = cache.respond(key, extra_headers)
+
+            if cached is not None:
+                return cached
+
+            try:
+                response, release = await self.open(url)
+            except httpx.HTTPError as error:
+                return PlainTextResponse(f"Bad Gateway: {type(error).__name__}", 502)
+
+        return self.respond(response, release, extra_headers, None if cache is None else cache.writer(key, response))
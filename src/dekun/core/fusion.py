@@ -0,0 +1,76 @@
+import torch.nn as nn
+import torch
+
+# Get the per-channel scale and shift that a batch normalization applies in evaluation mode.
+def batch_norm_transform(normalization: nn.BatchNorm2d):
+    if normalization.running_mean is None or normalization.running_var is None:
+        raise ValueError("The batch normalization does not track its running statistics")
+
+    scale = torch.rsqrt(normalization.running_var + normalization.eps)
+
+    if normalization.weight is not None:
+        scale = scale * normalization.weight
+
+    shift = -normalization.running_mean * scale
+
+    if normalization.bias is not None:
+        shift = shift + normalization.bias
+
+    return scale, shift
+
+# Scale and shift the output channels of a convolution in place, a bias is added when the convolution has none.
+def transform_convolution(convolution: nn.Conv2d, scale: torch.Tensor, shift: torch.Tensor):
+    with torch.no_grad():
+        convolution.weight.mul_(scale.view(-1, 1, 1, 1))
+
+        if convolution.bias is None:
+            convolution.bias = nn.Parameter(shift.clone())
+        else:
+            convolution.bias.mul_(scale).add_(shift)
+
+# Fold a batch normalization into the convolution before it.
+def fold_batch_norm(convolution: nn.Conv2d, normalization: nn.BatchNorm2d):
+    scale, shift = batch_norm_transform(normalization)
+
+    transform_convolution(convolution, scale, shift)
+
+# Fold a batch normalization into the transposed convolution before it, the output channels of a transposed convolution are the second axis of its weight.
+def fold_transposed_batch_norm(convolution: nn.ConvTranspose2d, normalization: nn.BatchNorm2d):
+    scale, shift = batch_norm_transform(normalization)
+
+    with torch.no_grad():
+        convolution.weight.mul_(scale.view(1, -1, 1, 1))
+
+        if convolution.bias is None:
+            convolution.bias = nn.Parameter(shift.clone())
+        else:
+            convolution.bias.mul_(scale).add_(shift)
+
+# Fold every batch normalization of a sequential module into the convolution before it, the folded batch normalizations are replaced with identities.
+def fold_sequential(sequential: nn.Sequential):
+    for index in range(1, len(sequential)):
+        normalization = sequential[index]
+        convolution = sequential[index - 1]
+
+        if not isinstance(normalization, nn.BatchNorm2d):
+            continue
+
+        if isinstance(convolution, nn.ConvTranspose2d):
+            fold_transposed_batch_norm(convolution, normalization)
+        elif isinstance(convolution, nn.Conv2d):
+            fold_batch_norm(convolution, normalization)
+        else:
+            continue
+
+        sequential[index] = nn.Identity()
+
+# Check if a fused model matches the original model on an example input, the tolerance is relative to the largest output.
+def verify_fusion(model: nn.Module, fused: nn.Module, example: torch.Tensor, tolerance: float = 1e-4):
+    model.eval()
+    fused.eval()
+
+    with torch.no_grad():
+        expected = model(example).float()
+        output = fused(example.contiguous(memory_format=torch.channels_last)).float()
+
+    return bool((expected - output).abs().max() <= tolerance * max(1.0, expected.abs().max().item()))
@@ -0,0 +1,57 @@
+from typing import Union
+from pathlib import Path
+import struct
+
+# The JPEG markers that start a frame and hold the size of the image.
+JPEG_FRAME_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# Read the size of a PNG or JPEG image (width, height) from its header, None is returned for other formats.
+def read_image_size(path: Path) -> Union[tuple[int, int], None]:
+    with open(path, "rb") as file:
+        header = file.read(24)
+
+        if header[0:8] == b"\x89PNG\r\n\x1a\n" and header[12:16] == b"IHDR":
+            width, height = struct.unpack(">II", header[16:24])
+
+            return width, height
+
+        if header[0:2] != b"\xff\xd8":
+            return None
+
+        file.seek(2)
+
+        while True:
+            byte = file.read(1)
+
+            if byte != b"\xff":
+                return None
+
+            while byte == b"\xff":
+                byte = file.read(1)
+
+            if len(byte) == 0:
+                return None
+
+            marker = byte[0]
+
+            if marker == 0xD9 or marker == 0xDA:
+                return None
+            if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+                continue
+
+            length = file.read(2)
+
+            if len(length) < 2:
+                return None
+
+            if marker in JPEG_FRAME_MARKERS:
+                frame = file.read(5)
+
+                if len(frame) < 5:
+                    return None
+
+                height, width = struct.unpack(">HH", frame[1:5])
+
+                return width, height
+
+            file.seek(struct.unpack(">H", length)[0] - 2, 1)
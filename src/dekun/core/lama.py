@@ -1,7 +1,12 @@
 from torchvision import models
 from typing import cast, List
+from tempfile import mkstemp
+from pathlib import Path
 import torch.nn as nn
 import torch
+import os
+
+from dekun.core.fusion import batch_norm_transform, transform_convolution, fold_batch_norm, fold_sequential
 
 # A 2D convolutional block.
 class ConvolutionalBlock(nn.Module):
@@ -26,6 +31,10 @@ class ConvolutionalBlock(nn.Module):
 
         self.block = nn.Sequential(*layers)
 
+    # Fold the batch normalization of the block into its convolution for inference.
+    def fuse(self):
+        fold_sequential(self.block)
+
     # Forward the convolutional block.
     def forward(self, input: torch.Tensor):
         return self.block(input)
@@ -37,6 +46,8 @@ class FourierUnit(nn.Module):
     def __init__(self, in_channels: int, out_channels: int, spectral_normalization: bool = False):
         super(FourierUnit, self).__init__()
 
+        self.spectral_normalization = spectral_normalization
+
         self.convolutional = nn.Sequential(
             nn.Conv2d(in_channels * 2, out_channels * 2, kernel_size=1, stride=1, padding=0),
             nn.ReLU(inplace=True),
@@ -48,17 +59,31 @@ class FourierUnit(nn.Module):
                 if isinstance(layer, nn.Conv2d):
                     nn.utils.spectral_norm(layer)
 
-    # Forward the fourier unit layer.
+    # Scale the output channels of the layer in place, the spectrum is linear so the scale is applied to the last convolution.
+    def scale_output(self, scale: torch.Tensor):
+        if self.spectral_normalization:
+            raise Exception("Cannot scale a spectral normalized fourier unit")
+
+        second = cast(nn.Conv2d, self.convolutional[2])
+
+        with torch.no_grad():
+            second.weight.mul_(scale.repeat(2).view(-1, 1, 1, 1))
+            second.bias.mul_(scale.repeat(2))
+
+    # Forward the fourier unit layer, the real and imaginary parts are split and joined through views of the spectrum instead of separate copies.
     def forward(self, input: torch.Tensor):
-        fft = torch.fft.rfft2(input, norm="ortho")
-        combined = torch.cat([fft.real, fft.imag], dim=1)
-        processed = self.convolutional(combined)
+        # The FFT does not support half precision on every backend (and bf16 on none), so the spectral path always runs in fp32.
+        with torch.autocast(input.device.type, enabled=False):
+            input = input.float()
+
+            fft = torch.fft.rfft2(input, norm="ortho")
+            combined = torch.view_as_real(fft).permute(0, 4, 1, 2, 3).reshape(fft.shape[0], fft.shape[1] * 2, fft.shape[2], fft.shape[3])
+            processed = self.convolutional(combined)
 
-        half_channels = processed.shape[1] // 2
-        real_processed, imaginary_processed = processed[:, :half_channels], processed[:, half_channels:]
-        fft_processed = torch.complex(real_processed, imaginary_processed)
+            half_channels = processed.shape[1] // 2
+            fft_processed = torch.view_as_complex(processed.view(processed.shape[0], 2, half_channels, processed.shape[2], processed.shape[3]).permute(0, 2, 3, 4, 1).contiguous())
 
-        return torch.fft.irfft2(fft_processed, s=(input.shape[2], input.shape[3]), norm="ortho")
+            return torch.fft.irfft2(fft_processed, s=(input.shape[2], input.shape[3]), norm="ortho")
 
 # A fast fourier convolution layer.
 class FastFourierConvolution(nn.Module):
@@ -82,9 +107,28 @@ class FastFourierConvolution(nn.Module):
         self.global_to_local_convolution = nn.Conv2d(in_global, out_local, kernel_size=1)
         self.fourier = FourierUnit(in_global, out_global, spectral_normalization)
 
-        self.normalize = nn.BatchNorm2d(out_channels)
+        self.normalize: nn.Module = nn.BatchNorm2d(out_channels)
         self.act = nn.ReLU(inplace=True)
 
+        self.fused = False
+
+    # Fold the batch normalization into the convolutions and the fourier unit for inference.
+    def fuse(self):
+        if self.fused:
+            return
+
+        scale, shift = batch_norm_transform(cast(nn.BatchNorm2d, self.normalize))
+        out_local = self.out_channels - int(self.out_channels * self.global_out_ratio)
+
+        transform_convolution(self.local_to_local_convolution, scale[:out_local], shift[:out_local])
+        transform_convolution(self.global_to_local_convolution, scale[:out_local], torch.zeros_like(shift[:out_local]))
+        transform_convolution(self.local_to_global_convolution, scale[out_local:], shift[out_local:])
+
+        self.fourier.scale_output(scale[out_local:])
+
+        self.normalize = nn.Identity()
+        self.fused = True
+
     # Forward the fast fourier convolution layer.
     def forward(self, input: torch.Tensor):
         global_input = int(self.in_channels * self.global_in_ratio)
@@ -99,6 +143,9 @@ class FastFourierConvolution(nn.Module):
             local_input = input[:, :self.in_channels - global_input]
             global_input = input[:, self.in_channels - global_input:]
 
+        if local_input is not None and global_input is not None and not torch.is_grad_enabled():
+            return self.act(self.normalize(self.forward_inference(local_input, global_input)))
+
         local_output = None
         global_output = None
 
@@ -118,6 +165,23 @@ class FastFourierConvolution(nn.Module):
 
         return self.act(output)
 
+    # Forward both paths into a preallocated output instead of concatenating them, out= does not support autograd so it is only used without gradients.
+    def forward_inference(self, local_input: torch.Tensor, global_input: torch.Tensor):
+        local_to_local = self.local_to_local_convolution(local_input)
+        global_to_local = self.global_to_local_convolution(global_input)
+        local_to_global = self.local_to_global_convolution(local_input)
+        fourier_global = self.fourier(global_input)
+
+        out_local = local_to_local.shape[1]
+        memory_format = torch.channels_last if local_to_local.is_contiguous(memory_format=torch.channels_last) and not local_to_local.is_contiguous() else torch.contiguous_format
+
+        output = torch.empty((local_to_local.shape[0], self.out_channels, local_to_local.shape[2], local_to_local.shape[3]), dtype=torch.promote_types(local_to_local.dtype, fourier_global.dtype), device=local_to_local.device, memory_format=memory_format)
+
+        torch.add(local_to_local, global_to_local, out=output[:, :out_local])
+        torch.add(local_to_global, fourier_global, out=output[:, out_local:])
+
+        return output
+
 # Residual fast fourier convolution block.
 class FFCResidualBlock(nn.Module):
 
@@ -127,9 +191,18 @@ class FFCResidualBlock(nn.Module):
 
         self.fast_fourier_convolution = FastFourierConvolution(channels, channels, global_in_ratio=global_ratio, global_out_ratio=global_ratio)
         self.convolutional = nn.Conv2d(channels, channels, kernel_size=3, padding=1)
-        self.normalize = nn.BatchNorm2d(channels)
+        self.normalize: nn.Module = nn.BatchNorm2d(channels)
         self.act = nn.ReLU(inplace=True)
 
+    # Fold the batch normalizations of the block into its convolutions for inference.
+    def fuse(self):
+        self.fast_fourier_convolution.fuse()
+
+        if isinstance(self.normalize, nn.BatchNorm2d):
+            fold_batch_norm(self.convolutional, self.normalize)
+
+            self.normalize = nn.Identity()
+
     # Foward the residual fast fourier convolution block.
     def forward(self, input: torch.Tensor):
         output = self.fast_fourier_convolution(input)
@@ -145,6 +218,8 @@ class LaMaGenerator(nn.Module):
     def __init__(self, inp_channels: int = 4, out_channels: int = 3, mid_channels: int =64, down_amount: int = 4, residual_amount: int = 8, global_ratio: float = 0.5):
         super(LaMaGenerator, self).__init__()
 
+        self.down_amount = down_amount
+
         self.input_convolution = nn.Sequential(
             nn.Conv2d(inp_channels, mid_channels, kernel_size=7, padding=3),
             nn.BatchNorm2d(mid_channels),
@@ -182,6 +257,19 @@ class LaMaGenerator(nn.Module):
             nn.Tanh()
         )
 
+    # Fold the batch normalizations into the convolutions and switch to the channels-last memory format for inference, the model cannot be trained afterwards.
+    def fuse_for_inference(self):
+        self.eval()
+
+        fold_sequential(self.input_convolution)
+        fold_sequential(self.encoder)
+        fold_sequential(self.decoder)
+
+        for block in self.bottleneck:
+            cast(FFCResidualBlock, block).fuse()
+
+        return self.to(memory_format=torch.channels_last)
+
     # Forward the LaMa generator.
     def forward(self, input: torch.Tensor):
         input = self.input_convolution(input)
@@ -218,15 +306,43 @@ class PatchDiscriminator(nn.Module):
     def forward(self, input: torch.Tensor):
         return self.model(input)
 
+# Load the pre-trained weights of the first layers of the VGG19 features, the classifier head is dropped once and the features are cached in a separate file that is memory-mapped afterwards.
+def load_vgg_features(layer_index: int):
+    weights = models.VGG19_Weights.IMAGENET1K_V1
+    path = Path(torch.hub.get_dir()).joinpath("checkpoints", f"{Path(weights.url).stem}-features.pth")
+
+    if not path.exists():
+        state = weights.get_state_dict(progress=False)
+
+        # Every process writes its own temporary file, so processes that build the cache at the same time never write into the same file.
+        path.parent.mkdir(parents=True, exist_ok=True)
+        file, temporary_path = mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+
+        try:
+            with os.fdopen(file, "wb") as temporary_file:
+                torch.save({name: tensor for name, tensor in state.items() if name.startswith("features.")}, temporary_file)
+
+            os.chmod(temporary_path, 0o644)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.unlink(temporary_path)
+
+            raise
+
+    state = torch.load(str(path), "cpu", mmap=True, weights_only=True)
+
+    return {name[len("features."):]: tensor for name, tensor in state.items() if int(name.split(".")[1]) < layer_index}
+
 # A VGG feature extractor.
 class VGGFeatureExtractor(nn.Module):
 
-    # Initialize a VGG feature extractor.
+    # Initialize a VGG feature extractor, only the first layers of VGG19 are built and only their pre-trained weights are read.
     def __init__(self, layer_index: int = 16):
         super(VGGFeatureExtractor, self).__init__()
 
-        self.vgg = models.vgg19(weights=models.VGG19_Weights.IMAGENET1K_V1).features
-        self.features = nn.Sequential(*list(self.vgg.children())[:layer_index])
+        self.features = nn.Sequential(*list(models.vgg.make_layers(models.vgg.cfgs["E"]).children())[:layer_index])
+
+        self.features.load_state_dict(load_vgg_features(layer_index))
 
         for param in self.features.parameters():
             param.requires_grad = False
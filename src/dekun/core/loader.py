@@ -0,0 +1,68 @@
+from typing import Union
+import torchvision
+import torch
+
+from dekun.core.cache import TensorCache
+from dekun.core.dataset import Dataset
+from dekun.core.distributed import get_rank, get_world_size
+from dekun.core.pack import Pack, resume_skip
+
+# A dataset loader of (image, mask) pairs, the images are only decoded and the batches are preprocessed on the training device.
+class Loader(torch.utils.data.Dataset):
+
+    # Initialize a dataset loader.
+    def __init__(self, dataset: Dataset, cache: Union[TensorCache, None] = None):
+        self.entries = []
+        self.cache = cache
+
+        for name in dataset.list():
+            self.entries.append(dataset.get(name))
+
+    # Get the size of the dataset.
+    def __len__(self):
+        return len(self.entries)
+
+    # Get an entry.
+    def __getitem__(self, index: int):
+        entry = self.entries[index]
+
+        if self.cache is not None and self.cache.has(entry.name):
+            return self.cache.get(entry.name)
+
+        image_tensor = torchvision.io.decode_image(str(entry.image_path), torchvision.io.ImageReadMode.RGB)
+        mask_tensor = torchvision.io.decode_image(str(entry.mask_path), torchvision.io.ImageReadMode.GRAY)
+
+        return image_tensor, mask_tensor
+
+# A packed dataset loader of (image, mask) pairs, the shards are streamed through a shuffle buffer.
+class PackedLoader(torch.utils.data.IterableDataset):
+
+    # Initialize a packed dataset loader.
+    def __init__(self, pack: Pack, shuffle_buffer: int = 256):
+        self.pack = pack
+        self.shuffle_buffer = shuffle_buffer
+
+        self.rank = get_rank()
+        self.world_size = get_world_size()
+
+        self.seed: Union[int, None] = None
+        self.batches = 0
+        self.batch_size = 1
+
+    # Set the shuffle seed of the next epoch and the amount of batches it skips.
+    def resume(self, seed: int, batches: int, batch_size: int):
+        self.seed = seed
+        self.batches = batches
+        self.batch_size = batch_size
+
+    # Get the amount of entries the current process has left in the epoch, the skipped entries are not counted.
+    def __len__(self):
+        return max(0, (self.pack.size() // self.world_size) - (self.batches * self.batch_size))
+
+    # Iterate through the entries.
+    def __iter__(self):
+        for _, image_data, mask_data in self.pack.iterate(self.shuffle_buffer, self.rank, self.world_size, self.seed, resume_skip(self.batches, self.batch_size)):
+            image_tensor = torchvision.io.decode_image(torch.frombuffer(bytearray(image_data), dtype=torch.uint8), torchvision.io.ImageReadMode.RGB)
+            mask_tensor = torchvision.io.decode_image(torch.frombuffer(bytearray(mask_data), dtype=torch.uint8), torchvision.io.ImageReadMode.GRAY)
+
+            yield image_tensor, mask_tensor
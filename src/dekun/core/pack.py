@@ -0,0 +1,162 @@
+from typing import Callable, Union, IO, cast
+from itertools import islice
+from pathlib import Path
+import tarfile
+import random
+import torch
+import json
+import os
+
+from dekun.core.dataset import Dataset
+
+# A packed dataset, the entries are stored in sequential tar shards.
+class Pack:
+
+    # Initialize a packed dataset.
+    def __init__(self, directory: Path):
+        index_path = directory.joinpath("pack.json")
+
+        if not index_path.exists():
+            raise Exception(f"The path is not a packed dataset: {str(directory)}")
+
+        index = json.loads(index_path.read_text())
+
+        self.directory = directory
+        self.shards = index["shards"]
+        self.entries = index["entries"]
+
+    # Get the size of the dataset.
+    def size(self):
+        return self.entries
+
+    # Iterate through the entries (name, image data, mask data) of the current process and worker, the same seed always gives the same order. The entries are split between the processes and the workers one by one instead of by shard, so every stream gets the same amount of entries (give or take one) even when there are fewer shards than streams.
+    def iterate(self, shuffle_buffer: int = 256, rank: int = 0, world_size: int = 1, seed: Union[int, None] = None, skip: int = 0):
+        worker_info = torch.utils.data.get_worker_info()
+
+        if worker_info == None:
+            worker_id = 0
+            worker_amount = 1
+        else:
+            worker_id = worker_info.id
+            worker_amount = worker_info.num_workers
+
+        if seed == None:
+            seed = int(torch.empty((), dtype=torch.int64).random_().item()) if worker_info == None else worker_info.seed - worker_info.id
+
+        shards = self.shards.copy()
+        random.Random(seed).shuffle(shards)
+
+        stream = (rank * worker_amount) + worker_id
+        streams = world_size * worker_amount
+
+        generator = random.Random(seed + stream + 1)
+
+        # Shuffle the entries through the buffer.
+        def shuffle():
+            buffer = []
+            offset = 0
+
+            for shard in shards:
+                first = (stream - offset) % streams
+                offset += shard["entries"]
+
+                for entry in read_shard(self.directory.joinpath(shard["name"]), first, streams):
+                    if len(buffer) < shuffle_buffer:
+                        buffer.append(entry)
+                    else:
+                        index = generator.randrange(len(buffer))
+
+                        yield buffer[index]
+
+                        buffer[index] = entry
+
+            generator.shuffle(buffer)
+
+            yield from buffer
+
+        return islice(shuffle(), skip, None)
+
+# Check if a directory is a packed dataset.
+def is_packed(directory: Path):
+    return directory.joinpath("pack.json").exists()
+
+# Read every step-th entry (name, image data, mask data) of a shard in order starting from the first, only the headers of the other entries are read.
+def read_shard(path: Path, first: int = 0, step: int = 1):
+    with tarfile.open(path, "r:") as archive:
+        index = 0
+        name = None
+        image_member = None
+
+        for member in archive:
+            if not member.isfile():
+                continue
+
+            parts = Path(member.name).stem.rsplit("-", 1)
+
+            if parts[1] == "image":
+                name = parts[0]
+                image_member = member
+            elif "mask" in parts[1] and parts[0] == name:
+                if index >= first and (index - first) % step == 0:
+                    yield name, cast(IO[bytes], archive.extractfile(cast(tarfile.TarInfo, image_member))).read(), cast(IO[bytes], archive.extractfile(member)).read()
+
+                index += 1
+                name = None
+                image_member = None
+            else:
+                raise Exception(f"Corrupted shard: {str(path)} ({member.name})")
+
+# Get the amount of entries the current worker skips to resume after a number of batches, the data loader takes the batches from the workers in turn.
+def resume_skip(batches: int, batch_size: int):
+    worker_info = torch.utils.data.get_worker_info()
+
+    if worker_info == None:
+        return batches * batch_size
+
+    return max(0, (batches - worker_info.id + worker_info.num_workers - 1) // worker_info.num_workers) * batch_size
+
+# Pack a dataset into tar shards.
+def pack_dataset(dataset: Dataset, output: Path, shard_size: int, callback: Union[Callable[[int], None], None] = None):
+    if shard_size < 1:
+        raise ValueError(f"Invalid shard size: {shard_size}")
+
+    output.mkdir(parents=True, exist_ok=True)
+    output.joinpath("pack.json").unlink(missing_ok=True)
+
+    shards = []
+    packed = 0
+    archive = None
+
+    # Close the current shard.
+    def close_shard():
+        if archive != None:
+            archive.close()
+
+            shards[-1]["size"] = output.joinpath(shards[-1]["name"]).stat().st_size
+
+    for name in dataset.list():
+        entry = dataset.get(name)
+
+        if archive == None or archive.offset >= shard_size:
+            close_shard()
+
+            shards.append({"name": f"shard-{len(shards):05d}.tar", "entries": 0, "size": 0})
+            archive = tarfile.open(output.joinpath(shards[-1]["name"]), "w", format=tarfile.GNU_FORMAT)
+
+        for path in [cast(Path, entry.image_path), cast(Path, entry.mask_path)]:
+            with open(path, "rb") as file:
+                archive.addfile(archive.gettarinfo(arcname=path.name, fileobj=file), file)
+
+        shards[-1]["entries"] += 1
+        packed += 1
+
+        if callback != None:
+            callback(packed)
+
+    close_shard()
+
+    temporary_path = output.joinpath("pack.tmp")
+    temporary_path.write_text(json.dumps({"entries": packed, "shards": shards}))
+    os.replace(temporary_path, output.joinpath("pack.json"))
+
+    return shards
@@ -0,0 +1,71 @@
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Any, Callable, Iterable
+from collections import deque
+from pathlib import Path
+from glob import glob
+import sys
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+# Resolve the image paths from a directory, a glob pattern or "-" (read from stdin).
+def resolve_paths(source: str) -> list[Path]:
+    if source == "-":
+        return [Path(line.strip()) for line in sys.stdin if len(line.strip()) > 0]
+
+    path = Path(source)
+
+    if path.is_dir():
+        return sorted(child for child in path.iterdir() if child.suffix.lower() in IMAGE_SUFFIXES and child.stem[0] != ".")
+
+    paths = sorted(Path(match) for match in glob(source, recursive=True))
+
+    if len(paths) == 0:
+        raise Exception(f"No image matches: {source}")
+
+    return paths
+
+# Run a decode -> process -> write pipeline, the decoding and writing happens in thread pools so they overlap with the processing.
+def run_pipeline(items: Iterable[Any], decode: Callable[[Any], Any], process: Callable[[list[Any]], list[Any]], write: Callable[[Any, Any], None], batch_size: int = 4, workers: int = 4) -> int:
+    if batch_size < 1:
+        raise ValueError(f"Invalid batch size: {batch_size}")
+    if workers < 1:
+        raise ValueError(f"Invalid worker amount: {workers}")
+
+    iterator = iter(items)
+    decodes: deque[tuple[Any, Future]] = deque()
+    writes: deque[Future] = deque()
+    amount = 0
+
+    with ThreadPoolExecutor(workers) as decoder, ThreadPoolExecutor(workers) as writer:
+
+        # Keep the decoders busy with the upcoming items.
+        def fill():
+            while len(decodes) < batch_size * 2:
+                item = next(iterator, None)
+
+                if item is None:
+                    break
+
+                decodes.append((item, decoder.submit(decode, item)))
+
+        fill()
+
+        while len(decodes) > 0:
+            batch = [decodes.popleft() for _ in range(min(batch_size, len(decodes)))]
+            fill()
+
+            items_batch = [item for item, _ in batch]
+            results = process([future.result() for _, future in batch])
+
+            for item, result in zip(items_batch, results):
+                writes.append(writer.submit(write, item, result))
+
+            while len(writes) > 0 and (writes[0].done() or len(writes) > batch_size * 2):
+                writes.popleft().result()
+
+            amount += len(batch)
+
+        while len(writes) > 0:
+            writes.popleft().result()
+
+    return amount
@@ -0,0 +1,115 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Union
+import asyncio
+
+# A scheduler that collects concurrent requests for a short time and processes them as one batch in a dedicated worker thread.
+class BatchScheduler:
+
+    # Initialize a batch scheduler.
+    def __init__(self, process: Callable[[list[Any]], list[Any]], max_batch_size: int = 8, max_wait: float = 0.005):
+        if max_batch_size < 1:
+            raise ValueError(f"Invalid max batch size: {max_batch_size}")
+        if max_wait < 0:
+            raise ValueError(f"Invalid max wait: {max_wait}")
+
+        self.process = process
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self.executor = ThreadPoolExecutor(1)
+        self.queue: Union[asyncio.Queue, None] = None
+        self.task: Union[asyncio.Task, None] = None
+
+        self.requests = 0
+        self.batches = 0
+        self.failures = 0
+        self.batch_sizes = {}
+        self.last_batch_size = 0
+        self.last_batch_duration = 0.0
+
+    # Start the scheduler.
+    def start(self):
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self.run())
+
+    # Stop the scheduler.
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+        self.executor.shutdown(wait=False)
+
+    # Submit an item and wait for its result.
+    async def submit(self, item: Any):
+        if self.queue is None:
+            raise Exception("The scheduler is not started")
+
+        future = asyncio.get_running_loop().create_future()
+
+        self.requests += 1
+        await self.queue.put((item, future))
+
+        return await future
+
+    # Run the scheduler.
+    async def run(self):
+        queue = self.queue
+
+        if queue is None:
+            raise Exception("The scheduler is not started")
+
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await queue.get()]
+
+            if self.max_batch_size > 1 and self.max_wait > 0:
+                await asyncio.sleep(self.max_wait)
+
+            while len(batch) < self.max_batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+
+            batch = [(item, future) for item, future in batch if not future.cancelled()]
+
+            if len(batch) == 0:
+                continue
+
+            start = loop.time()
+
+            try:
+                results = await loop.run_in_executor(self.executor, self.process, [item for item, _ in batch])
+
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+            except Exception as error:
+                self.failures += 1
+
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+
+            self.batches += 1
+            self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+            self.last_batch_size = len(batch)
+            self.last_batch_duration = loop.time() - start
+
+    # Get the metrics of the scheduler.
+    def metrics(self):
+        processed = sum(size * amount for size, amount in self.batch_sizes.items())
+
+        return {
+            "queue_depth": 0 if self.queue is None else self.queue.qsize(),
+            "requests": self.requests,
+            "batches": self.batches,
+            "failures": self.failures,
+            "average_batch_size": processed / self.batches if self.batches > 0 else 0.0,
+            "last_batch_size": self.last_batch_size,
+            "last_batch_duration": self.last_batch_duration,
+            "batch_sizes": {str(size): amount for size, amount in sorted(self.batch_sizes.items())}
+        }
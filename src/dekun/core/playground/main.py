@@ -5,26 +5,122 @@ from starlette.requests import Request
 from starlette.routing import Mount
 from hypercorn.config import Config
 from hypercorn.asyncio import serve
-from typing import Union
+from contextlib import asynccontextmanager
+from base64 import b64decode
+from typing import Union, cast
 from pathlib import Path
+import torchvision
 import asyncio
 import uvloop
+import torch
 
+from dekun.core.playground.batcher import BatchScheduler
 from dekun.inpainter.model import Inpainter
+from dekun.core.utils import fit_tensor
 from dekun.marker.model import Marker
 
+# Decode an image from base64.
+def decode_image(data: str, mode: torchvision.io.ImageReadMode):
+    return torchvision.io.decode_image(torch.frombuffer(bytearray(b64decode(data)), dtype=torch.uint8), mode)
+
+# Encode an image into PNG.
+def encode_image(tensor: torch.Tensor):
+    return torchvision.io.encode_png((tensor.detach().cpu().clamp(0, 1) * 255).round().to(torch.uint8)).numpy().tobytes()
+
 # Start the playground.
-def start_playground(port: int, marker: Union[Marker, None], inpainter: Union[Inpainter, None]):
+def start_playground(port: int, marker: Union[Marker, None], inpainter: Union[Inpainter, None], max_batch_size: int = 8, max_wait: float = 0.005):
     static_directory = Path(__file__).parent.joinpath("static")
 
+    # Mark a batch of fitted images.
+    def mark_batch(items: list[tuple[torch.Tensor, tuple[int, int, int, int], tuple[int, int]]]):
+        return [encode_image(mask.unsqueeze(0)) for mask in cast(Marker, marker).mark_fitted(torch.stack([item[0] for item in items]), [item[1] for item in items], [item[2] for item in items])]
+
+    # Inpaint a batch of fitted images.
+    def inpaint_batch(items: list[tuple[torch.Tensor, torch.Tensor, tuple[int, int, int, int], tuple[int, int]]]):
+        return [encode_image(image) for image in cast(Inpainter, inpainter).inpaint_fitted(torch.stack([item[0] for item in items]), torch.stack([item[1] for item in items]), [item[2] for item in items], [item[3] for item in items])]
+
+    mark_scheduler = BatchScheduler(mark_batch, max_batch_size, max_wait)
+    inpaint_scheduler = BatchScheduler(inpaint_batch, max_batch_size, max_wait)
+
+    @asynccontextmanager
+    async def lifespan(_: Starlette):
+        mark_scheduler.start()
+        inpaint_scheduler.start()
+
+        yield
+
+        await mark_scheduler.stop()
+        await inpaint_scheduler.stop()
+
     app = Starlette(routes = [
          Mount('/assets', app = StaticFiles(directory = static_directory.joinpath("assets")), name = "assets")
-    ])
+    ], lifespan = lifespan)
 
     @app.route("/")
     async def index_html(_: Request):
         return FileResponse(static_directory.joinpath("index.html"))
 
+    @app.route("/api/mark", methods=["POST"])
+    async def mark(request: Request):
+        if marker == None:
+            return PlainTextResponse("No marker is loaded", 404)
+
+        try:
+            data = await request.json()
+        except ValueError as error:
+            return PlainTextResponse(f"Invalid request: {error}", 400)
+
+        # Decode and fit the image.
+        def prepare():
+            image = decode_image(data["image"], torchvision.io.ImageReadMode.RGB)
+            resized_image, transform = fit_tensor(image, cast(Marker, marker).width, cast(Marker, marker).height)
+
+            return resized_image.float() / 255, transform, (image.shape[2], image.shape[1])
+
+        try:
+            item = await asyncio.get_running_loop().run_in_executor(None, prepare)
+        except Exception as error:
+            return PlainTextResponse(f"Invalid request: {error}", 400)
+
+        return Response(await mark_scheduler.submit(item), 200, media_type="image/png")
+
+    @app.route("/api/inpaint", methods=["POST"])
+    async def inpaint(request: Request):
+        if inpainter == None:
+            return PlainTextResponse("No inpainter is loaded", 404)
+
+        try:
+            data = await request.json()
+        except ValueError as error:
+            return PlainTextResponse(f"Invalid request: {error}", 400)
+
+        # Decode and fit the image and the mask.
+        def prepare():
+            image = decode_image(data["image"], torchvision.io.ImageReadMode.RGB)
+            mask = decode_image(data["mask"], torchvision.io.ImageReadMode.GRAY)
+
+            if image.shape[1:] != mask.shape[1:]:
+                raise ValueError(f"The size of the image and the mask does not match: {image.shape[2]}x{image.shape[1]} != {mask.shape[2]}x{mask.shape[1]}")
+
+            resized_image, transform = fit_tensor(image, cast(Inpainter, inpainter).width, cast(Inpainter, inpainter).height)
+            resized_mask = fit_tensor(mask, cast(Inpainter, inpainter).width, cast(Inpainter, inpainter).height)[0]
+
+            return resized_image.float() / 255, resized_mask.float() / 255, transform, (image.shape[2], image.shape[1])
+
+        try:
+            item = await asyncio.get_running_loop().run_in_executor(None, prepare)
+        except Exception as error:
+            return PlainTextResponse(f"Invalid request: {error}", 400)
+
+        return Response(await inpaint_scheduler.submit(item), 200, media_type="image/png")
+
+    @app.route("/api/metrics")
+    async def metrics(_: Request):
+        return JSONResponse({
+            "mark": mark_scheduler.metrics(),
+            "inpaint": inpaint_scheduler.metrics()
+        }, 200)
+
     config = Config()
     config.bind = [f"0.0.0.0:{str(port)}"]
 
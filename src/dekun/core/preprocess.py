@@ -0,0 +1,108 @@
+from typing import Union
+import torch
+
+from dekun.core.bucket import nearest_bucket
+
+# Collate decoded images of different sizes into a batch, every tensor is padded to the largest size at the top-left corner and the sizes (width, height) are kept.
+def collate_images(tensors: list[torch.Tensor]):
+    height = max(tensor.shape[1] for tensor in tensors)
+    width = max(tensor.shape[2] for tensor in tensors)
+
+    batch = torch.zeros((len(tensors), tensors[0].shape[0], height, width), dtype=tensors[0].dtype)
+    sizes = torch.tensor([(tensor.shape[2], tensor.shape[1]) for tensor in tensors], dtype=torch.float32)
+
+    for index, tensor in enumerate(tensors):
+        batch[index, :, :tensor.shape[1], :tensor.shape[2]] = tensor
+
+    return batch, sizes
+
+# Collate a batch of decoded (image, mask) pairs into (images, image sizes, masks, mask sizes).
+def collate_samples(samples: list[tuple[torch.Tensor, torch.Tensor]]):
+    images, image_sizes = collate_images([sample[0] for sample in samples])
+    masks, mask_sizes = collate_images([sample[1] for sample in samples])
+
+    return images, image_sizes, masks, mask_sizes
+
+# A batched preprocessor that letterboxes, flips and crops a batch on the training device with a single resampling.
+class Preprocessor:
+
+    # Initialize a preprocessor, the flip is the chance of flipping an image horizontally and the crop is the smallest scale of a random crop.
+    def __init__(self, width: int, height: int, flip: float = 0.0, crop: float = 1.0, buckets: Union[list[tuple[int, int]], None] = None):
+        if width < 1:
+            raise ValueError(f"Invalid width: {width}")
+        if height < 1:
+            raise ValueError(f"Invalid height: {height}")
+        if flip < 0 or flip > 1:
+            raise ValueError(f"Invalid flip chance: {flip}")
+        if crop <= 0 or crop > 1:
+            raise ValueError(f"Invalid crop scale: {crop}")
+
+        self.width = width
+        self.height = height
+        self.flip = flip
+        self.crop = crop
+        self.buckets = buckets
+
+    # Create the random augmentation (scale x, scale y, translation x, translation y) of every sample in the output space, the identity is returned when not augmenting.
+    def augmentation(self, amount: int, device: torch.device, augment: bool = True):
+        scale = torch.ones((amount,), device=device)
+        translation = torch.zeros((amount, 2), device=device)
+        flip = torch.ones((amount,), device=device)
+
+        if augment and self.crop < 1:
+            scale = self.crop + (torch.rand((amount,), device=device) * (1 - self.crop))
+            translation = (torch.rand((amount, 2), device=device) * 2 - 1) * (1 - scale).unsqueeze(1)
+
+        if augment and self.flip > 0:
+            flip = torch.where(torch.rand((amount,), device=device) < self.flip, -1.0, 1.0)
+
+        return scale * flip, scale, translation[:, 0], translation[:, 1]
+
+    # Create the sampling grid that letterboxes a padded batch into the output size, the grid is separable since there is no rotation.
+    def grid(self, sizes: torch.Tensor, padded_width: int, padded_height: int, width: int, height: int, augmentation: tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]):
+        widths = sizes[:, 0]
+        heights = sizes[:, 1]
+
+        fit_scale = torch.minimum(width / widths, height / heights)
+        scale_x = width / (fit_scale * padded_width)
+        scale_y = height / (fit_scale * padded_height)
+
+        output_x = ((torch.arange(width, device=sizes.device) * 2 + 1) / width) - 1
+        output_y = ((torch.arange(height, device=sizes.device) * 2 + 1) / height) - 1
+
+        grid_x = ((scale_x * augmentation[0]).unsqueeze(1) * output_x) + ((scale_x * augmentation[2]) + (widths / padded_width) - 1).unsqueeze(1)
+        grid_y = ((scale_y * augmentation[1]).unsqueeze(1) * output_y) + ((scale_y * augmentation[3]) + (heights / padded_height) - 1).unsqueeze(1)
+
+        return torch.stack((grid_x.unsqueeze(1).expand(-1, height, -1), grid_y.unsqueeze(2).expand(-1, -1, width)), dim=3)
+
+    # Letterbox a padded batch into an output size.
+    def letterbox(self, batch: torch.Tensor, sizes: torch.Tensor, width: int, height: int, augmentation: tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]):
+        return torch.nn.functional.grid_sample(batch, self.grid(sizes, batch.shape[3], batch.shape[2], width, height, augmentation), mode="bilinear", padding_mode="zeros", align_corners=False)
+
+    # Get the output size of a batch, the bucket with the closest aspect ratio to the batch is used when there are buckets.
+    def output_size(self, sizes: torch.Tensor):
+        if self.buckets == None:
+            return self.width, self.height
+
+        return self.buckets[nearest_bucket(self.buckets, float(torch.exp(torch.log(sizes[:, 0] / sizes[:, 1]).mean())))]
+
+    # Preprocess a collated batch into normalized images and masks on the device, the augmentation is skipped when not training.
+    def process(self, images: torch.Tensor, image_sizes: torch.Tensor, masks: torch.Tensor, mask_sizes: torch.Tensor, device: torch.device, augment: bool = True):
+        width, height = self.output_size(image_sizes)
+
+        images = images.to(device, non_blocking=True)
+        masks = masks.to(device, non_blocking=True)
+        image_sizes = image_sizes.to(device)
+        mask_sizes = mask_sizes.to(device)
+        augmentation = self.augmentation(images.shape[0], device, augment)
+
+        if images.shape[2:] == masks.shape[2:] and torch.equal(image_sizes, mask_sizes):
+            output = self.letterbox(torch.cat((images, masks), dim=1).float() / 255, image_sizes, width, height, augmentation)
+
+            return output[:, :images.shape[1]], output[:, images.shape[1]:]
+
+        return self.letterbox(images.float() / 255, image_sizes, width, height, augmentation), self.letterbox(masks.float() / 255, mask_sizes, width, height, augmentation)
+
+# Apply masks onto a batch of images, the masked pixels are filled with black.
+def apply_masks(images: torch.Tensor, masks: torch.Tensor) -> torch.Tensor:
+    return images * (masks <= 0.5).to(images.dtype)
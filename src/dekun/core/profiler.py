@@ -0,0 +1,92 @@
+from typing import Iterable, Union
+from time import perf_counter
+from pathlib import Path
+import torch
+
+# Get the peak memory usage (in bytes) of the device, the peak RSS of the process is used on CPU.
+def peak_memory(device: torch.device) -> Union[int, None]:
+    if device.type == "cuda":
+        return torch.cuda.max_memory_allocated(device)
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+# A timer that splits the time of the training steps into the time waiting for the data and the time computing.
+class StepTimer:
+
+    # Initialize a step timer.
+    def __init__(self, device: torch.device):
+        self.device = device
+
+        self.data_time = 0.0
+        self.start = 0.0
+
+    # Iterate through the batches, the time spent waiting for each batch is measured.
+    def measure(self, batches: Iterable):
+        if self.device.type == "cuda":
+            torch.cuda.reset_peak_memory_stats(self.device)
+
+        start = perf_counter()
+
+        for batch in batches:
+            self.start = perf_counter()
+            self.data_time = self.start - start
+
+            yield batch
+
+            start = perf_counter()
+
+    # Finish the current step and get its (data time, compute time).
+    def finish(self):
+        if self.device.type == "cuda":
+            torch.cuda.synchronize(self.device)
+
+        return self.data_time, perf_counter() - self.start
+
+# A profiler that captures the steps of the training into a Chrome trace, the first step is skipped and the second one is used for warming up.
+class Profiler:
+
+    # Initialize a profiler.
+    def __init__(self, path: Path, steps: int, device: torch.device):
+        if steps < 1:
+            raise ValueError(f"Invalid profile steps: {steps}")
+
+        activities = [torch.profiler.ProfilerActivity.CPU]
+
+        if device.type == "cuda":
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+
+        self.path = path
+        self.steps = steps
+        self.finished = False
+
+        self.profile = torch.profiler.profile(
+            activities=activities,
+            schedule=torch.profiler.schedule(wait=1, warmup=1, active=steps, repeat=1),
+            on_trace_ready=self.export,
+
+            record_shapes=True,
+            profile_memory=True
+        )
+
+        self.profile.start()
+
+    # Export the trace.
+    def export(self, profile: torch.profiler.profile):
+        profile.export_chrome_trace(str(self.path))
+
+        self.finished = True
+
+    # Mark the end of a step.
+    def step(self):
+        if not self.finished:
+            self.profile.step()
+
+    # Stop the profiler, the captured steps are exported if the training ends before the capture does.
+    def stop(self):
+        if not self.finished:
+            self.profile.stop()
@@ -0,0 +1,29 @@
+from math import ceil
+import torch
+
+# A sampler that splits the dataset between the processes like DistributedSampler, an epoch can be resumed after a number of batches.
+class ResumableSampler(torch.utils.data.Sampler[int]):
+
+    # Initialize a resumable sampler.
+    def __init__(self, size: int, rank: int = 0, world_size: int = 1):
+        self.size = size
+        self.rank = rank
+        self.world_size = world_size
+
+        self.amount = ceil(size / world_size)
+        self.start = 0
+
+    # Set the amount of batches the next epoch skips, the order does not depend on the seed.
+    def resume(self, seed: int, batches: int, batch_size: int):
+        self.start = batches * batch_size
+
+    # Get the amount of indices the current process has left in the epoch, the skipped indices are not counted.
+    def __len__(self):
+        return max(0, self.amount - self.start)
+
+    # Iterate through the indices of the current process, the dataset is padded so every process gets the same amount.
+    def __iter__(self):
+        indices = list(range(self.size))
+        indices += indices[:(self.amount * self.world_size) - self.size]
+
+        return iter(indices[self.rank::self.world_size][self.start:])
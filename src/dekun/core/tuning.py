@@ -0,0 +1,115 @@
+from typing import Callable, Iterable, Union
+from contextlib import contextmanager
+from time import perf_counter
+import torch
+
+# Check if an error is caused by running out of memory, the CPU allocator raises a plain runtime error.
+def is_out_of_memory(error: BaseException):
+    if isinstance(error, (torch.cuda.OutOfMemoryError, MemoryError)):
+        return True
+    if not isinstance(error, RuntimeError):
+        return False
+
+    message = str(error).lower()
+
+    return "out of memory" in message or "can't allocate memory" in message or "cannot allocate memory" in message
+
+# Wait for the device to finish its work.
+def synchronize(device: torch.device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+# Free the cached memory of the device.
+def empty_cache(device: torch.device):
+    if device.type == "cuda":
+        torch.cuda.empty_cache()
+
+# Restore the buffers of modules (like the running statistics of the batch normalizations) after a block, so probing training steps do not change the models.
+@contextmanager
+def preserve_buffers(*modules: torch.nn.Module):
+    buffers = [(buffer, buffer.detach().clone()) for module in modules for buffer in module.buffers()]
+
+    try:
+        yield
+    finally:
+        with torch.no_grad():
+            for buffer, saved in buffers:
+                buffer.copy_(saved)
+
+# Find the largest batch size (a power of 2) that fits in memory, the samples per second of every candidate are reported through the callback.
+def find_batch_size(step: Callable[[int], None], device: torch.device, max_batch_size: int = 256, steps: int = 3, callback: Union[Callable[[int, float], None], None] = None):
+    if max_batch_size < 1:
+        raise ValueError(f"Invalid max batch size: {max_batch_size}")
+    if steps < 1:
+        raise ValueError(f"Invalid steps: {steps}")
+
+    results = {}
+    batch_size = 1
+
+    while batch_size <= max_batch_size:
+        try:
+            step(batch_size)
+            synchronize(device)
+
+            start = perf_counter()
+
+            for _ in range(steps):
+                step(batch_size)
+
+            synchronize(device)
+        except (RuntimeError, MemoryError) as error:
+            if not is_out_of_memory(error):
+                raise
+
+            empty_cache(device)
+
+            break
+
+        results[batch_size] = (batch_size * steps) / (perf_counter() - start)
+
+        if callback != None:
+            callback(batch_size, results[batch_size])
+
+        batch_size *= 2
+
+    if len(results) == 0:
+        raise Exception("Not enough memory for a batch size of 1")
+
+    return max(results), results
+
+# Find the smallest worker amount that loads the data as fast as the device consumes it, the samples per second of every candidate are reported through the callback and the default is kept when no throughput could be measured.
+def find_worker_amount(create_loader: Callable[[int], Iterable], batch_size: int, target: float, max_workers: int, batches: int = 8, callback: Union[Callable[[int, float], None], None] = None, default: Union[int, None] = None):
+    results = {}
+    workers = 0
+
+    while workers <= max_workers:
+        iterator = iter(create_loader(workers))
+
+        if next(iterator, None) == None:
+            raise Exception("The dataset is empty")
+
+        start = perf_counter()
+        amount = 0
+
+        for _ in range(batches):
+            if next(iterator, None) == None:
+                break
+
+            amount += 1
+
+        results[workers] = (amount * batch_size) / max(perf_counter() - start, 1e-9)
+
+        del iterator
+
+        if callback != None:
+            callback(workers, results[workers])
+
+        if results[workers] >= target:
+            return workers, results
+
+        workers = 1 if workers == 0 else workers * 2
+
+    if max(results.values()) <= 0:
+        return default, results
+
+    return max(results, key=lambda workers: results[workers]), results
@@ -1,6 +1,8 @@
 import torch.nn as nn
 import torch
 
+from dekun.core.fusion import fold_sequential
+
 # A double convolutional block.
 class DoubleConvolutionalBlock(nn.Module):
 
@@ -17,6 +19,10 @@ class DoubleConvolutionalBlock(nn.Module):
             nn.ReLU(inplace=True)
         )
 
+    # Fold the batch normalizations of the block into its convolutions for inference.
+    def fuse(self):
+        fold_sequential(self.block)
+
     def forward(self, input: torch.Tensor):
         return self.block(input)
 
@@ -55,6 +61,16 @@ class UNet(nn.Module):
 
         self.final_convolution = nn.Conv2d(features[0], out_channels, kernel_size=1)
 
+    # Fold the batch normalizations into the convolutions and switch to the channels-last memory format for inference, the model cannot be trained afterwards.
+    def fuse_for_inference(self):
+        self.eval()
+
+        for module in self.modules():
+            if isinstance(module, DoubleConvolutionalBlock):
+                module.fuse()
+
+        return self.to(memory_format=torch.channels_last)
+
     # Forward the U-Net. 
     def forward(self, input: torch.Tensor):
         factor = 2 ** len(self.downs)
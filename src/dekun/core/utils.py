@@ -1,5 +1,11 @@
+from typing import Callable, Union
+from pathlib import Path
+import warnings
+import random
 import torch
 
+from dekun.core.distributed import get_world_size
+
 # Training progress info.
 class TrainProgress:
 
@@ -9,6 +15,68 @@ class TrainProgress:
         self.loss = loss
         self.duration = duration
 
+# Training step progress info, the times are in seconds and the peak memory is in bytes.
+class StepProgress:
+
+    # Initialize a training step progress info.
+    def __init__(self, iteration: int, step: int, steps: Union[int, None], loss: float, samples: int, data_time: float, compute_time: float, peak_memory: Union[int, None]):
+        self.iteration = iteration
+        self.step = step
+        self.steps = steps
+        self.loss = loss
+        self.samples = samples
+        self.data_time = data_time
+        self.compute_time = compute_time
+        self.peak_memory = peak_memory
+
+    # Get the samples per second of the step.
+    def samples_per_second(self):
+        return self.samples / max(self.data_time + self.compute_time, 1e-9)
+
+# Get the state of the random number generators.
+def get_rng_state():
+    return {
+        "python": random.getstate(),
+        "torch": torch.get_rng_state(),
+        "cuda": torch.cuda.get_rng_state_all() if torch.cuda.is_available() else []
+    }
+
+# Restore the state of the random number generators.
+def set_rng_state(state: dict):
+    random.setstate(state["python"])
+    torch.set_rng_state(state["torch"].cpu())
+
+    if torch.cuda.is_available() and len(state["cuda"]) == torch.cuda.device_count():
+        torch.cuda.set_rng_state_all([cuda_state.cpu() for cuda_state in state["cuda"]])
+
+# Create the position of a training in the middle of an epoch.
+def create_position(seed: int, step: int, batch_size: int, loss_total: float, loss_amount: int):
+    return {
+        "seed": seed,
+        "step": step,
+        "batch_size": batch_size,
+        "world_size": get_world_size(),
+
+        "loss_total": loss_total,
+        "loss_amount": loss_amount,
+
+        "rng_state": get_rng_state()
+    }
+
+# Check if a training can resume from a position, the random number generators are restored when it can.
+def resume_position(position: Union[dict, None], batch_size: int) -> Union[dict, None]:
+    if position == None:
+        return None
+
+    if position["batch_size"] != batch_size or position["world_size"] != get_world_size():
+        warnings.warn(f"The epoch is restarted, the checkpoint was saved with a batch size of {position['batch_size']} on {position['world_size']} processes")
+
+        return None
+
+    set_rng_state(position["rng_state"])
+
+    return position
+
 # Resolve a device.
 def resolve_device(device: str):
     if device == "auto":
@@ -38,6 +106,55 @@ def resolve_device(device: str):
     else:
         raise ValueError(f"Unsupported device: {device}")
 
+# Create an autocast context for a precision.
+def autocast(device: torch.device, precision: str):
+    if precision == "fp32":
+        return torch.autocast(device.type, enabled=False)
+    elif precision == "bf16":
+        return torch.autocast(device.type, dtype=torch.bfloat16)
+    elif precision == "fp16":
+        return torch.autocast(device.type, dtype=torch.float16)
+    else:
+        raise ValueError(f"Unsupported precision: {precision} (fp32|bf16|fp16)")
+
+# Build a model, the random initialization is skipped when the weights are loaded from a state.
+def build_model(factory: Callable[[], torch.nn.Module], device: torch.device, state: Union[dict, None] = None):
+    if state == None:
+        return factory().to(device)
+
+    with torch.device("meta"):
+        model = factory()
+
+    model.load_state_dict(state, assign=True)
+
+    return model.to(device, torch.float32)
+
+# Trace a model for a fixed input shape, the traced model is cached at the specified path and rebuilt when the checkpoint is newer.
+def trace_model(model: torch.nn.Module, example: torch.Tensor, checkpoint_path: Path, cache_path: Path) -> Union[torch.jit.ScriptModule, None]:
+    if cache_path.exists() and cache_path.stat().st_mtime >= checkpoint_path.stat().st_mtime:
+        try:
+            return torch.jit.load(str(cache_path), map_location=example.device)
+        except Exception as error:
+            print(f"Failed to load the compiled model, rebuilding: {error}")
+
+    try:
+        model.eval()
+
+        with torch.no_grad(), warnings.catch_warnings():
+            warnings.simplefilter("ignore", torch.jit.TracerWarning)
+            traced_model = torch.jit.freeze(torch.jit.trace(model, example, check_trace=False))
+    except Exception as error:
+        print(f"Failed to compile the model, falling back to eager mode: {error}")
+
+        return None
+
+    try:
+        torch.jit.save(traced_model, str(cache_path))
+    except Exception as error:
+        print(f"Failed to cache the compiled model: {error}")
+
+    return traced_model
+
 # Fit a tensor into a specified size.
 def fit_tensor(tensor: torch.Tensor, width: int, height: int):
     if len(tensor.shape) != 3:
@@ -68,6 +185,130 @@ def fit_tensor(tensor: torch.Tensor, width: int, height: int):
 
     return torch.nn.functional.pad(resized_tensor, (pad_left, pad_right, pad_top, pad_bottom)), (offset_x, offset_y, new_width, new_height)
 
+# Restore a fitted tensor back to its original size.
+def unfit_tensor(tensor: torch.Tensor, transform: tuple[int, int, int, int], width: int, height: int):
+    if len(tensor.shape) != 3:
+        raise ValueError(f"Unsupported tensor shape: {tensor.shape}")
+
+    cropped_tensor = tensor[:, transform[1]:transform[1] + transform[3], transform[0]:transform[0] + transform[2]]
+
+    return torch.nn.functional.interpolate(cropped_tensor.unsqueeze(0), size=(height, width)).squeeze(0)
+
+# Calculate the start positions of overlapping tiles along an axis.
+def tile_positions(length: int, tile: int, overlap: int):
+    if tile < 1:
+        raise ValueError(f"Invalid tile size: {tile}")
+    if overlap < 0 or overlap >= tile:
+        raise ValueError(f"Invalid tile overlap: {overlap}")
+
+    if length <= tile:
+        return [0]
+
+    return list(range(0, length - tile, tile - overlap)) + [length - tile]
+
+# Create the feathered blending weight of a tile.
+def tile_weight(width: int, height: int, overlap: int):
+    ramp_x = torch.clamp((torch.arange(width, dtype=torch.float32) + 1) / (overlap + 1), max=1.0)
+    ramp_y = torch.clamp((torch.arange(height, dtype=torch.float32) + 1) / (overlap + 1), max=1.0)
+
+    ramp_x = torch.minimum(ramp_x, ramp_x.flip(0))
+    ramp_y = torch.minimum(ramp_y, ramp_y.flip(0))
+
+    return (ramp_y.unsqueeze(1) * ramp_x.unsqueeze(0)).unsqueeze(0)
+
+# Run a function over the overlapping tiles of a tensor and blend the outputs, returns the blended output and the total weight of each pixel.
+def tile_tensor(tensor: torch.Tensor, forward: Callable[[torch.Tensor], torch.Tensor], tile: int, overlap: int, batch_size: int = 4, select: Union[Callable[[torch.Tensor], bool], None] = None):
+    if len(tensor.shape) != 3:
+        raise ValueError(f"Unsupported tensor shape: {tensor.shape}")
+
+    height = tensor.shape[1]
+    width = tensor.shape[2]
+
+    padded_tensor = torch.nn.functional.pad(tensor, (0, max(tile - width, 0), 0, max(tile - height, 0)))
+    weight = tile_weight(tile, tile, overlap)
+
+    output = None
+    total_weight = torch.zeros((1, padded_tensor.shape[1], padded_tensor.shape[2]))
+    tiles = []
+
+    for y in tile_positions(padded_tensor.shape[1], tile, overlap):
+        for x in tile_positions(padded_tensor.shape[2], tile, overlap):
+            if select == None or select(padded_tensor[:, y:y + tile, x:x + tile]):
+                tiles.append((x, y))
+
+    for index in range(0, len(tiles), batch_size):
+        batch = tiles[index:index + batch_size]
+        outputs = forward(torch.stack([padded_tensor[:, y:y + tile, x:x + tile] for x, y in batch])).cpu()
+
+        if output is None:
+            output = torch.zeros((outputs.shape[1], padded_tensor.shape[1], padded_tensor.shape[2]))
+
+        for (x, y), tile_output in zip(batch, outputs):
+            output[:, y:y + tile, x:x + tile] += tile_output * weight
+            total_weight[:, y:y + tile, x:x + tile] += weight
+
+    if output is None:
+        return None, total_weight[:, :height, :width]
+
+    return output[:, :height, :width], total_weight[:, :height, :width]
+
+# Find the bounding boxes (left, top, right, bottom) of the connected regions in a mask, expanded by a margin.
+def mask_regions(mask: torch.Tensor, margin: int = 32, cell: int = 8):
+    if len(mask.shape) != 3:
+        raise ValueError(f"Unsupported tensor shape: {mask.shape}")
+
+    height = mask.shape[1]
+    width = mask.shape[2]
+
+    grid = torch.nn.functional.max_pool2d((mask[0:1] > 0.5).float().unsqueeze(0), cell, ceil_mode=True)[0, 0] > 0
+    remaining = set((int(y), int(x)) for y, x in grid.nonzero().tolist())
+    boxes = []
+
+    while len(remaining) > 0:
+        stack = [remaining.pop()]
+        top, left = stack[0]
+        bottom, right = stack[0]
+
+        while len(stack) > 0:
+            y, x = stack.pop()
+
+            top = min(top, y)
+            left = min(left, x)
+            bottom = max(bottom, y)
+            right = max(right, x)
+
+            for offset_y in (-1, 0, 1):
+                for offset_x in (-1, 0, 1):
+                    neighbour = (y + offset_y, x + offset_x)
+
+                    if neighbour in remaining:
+                        remaining.remove(neighbour)
+                        stack.append(neighbour)
+
+        boxes.append((max(left * cell - margin, 0), max(top * cell - margin, 0), min((right + 1) * cell + margin, width), min((bottom + 1) * cell + margin, height)))
+
+    merged = True
+
+    while merged:
+        merged = False
+
+        for index in range(len(boxes)):
+            for other_index in range(index + 1, len(boxes)):
+                box = boxes[index]
+                other_box = boxes[other_index]
+
+                if box[0] < other_box[2] and other_box[0] < box[2] and box[1] < other_box[3] and other_box[1] < box[3]:
+                    boxes[index] = (min(box[0], other_box[0]), min(box[1], other_box[1]), max(box[2], other_box[2]), max(box[3], other_box[3]))
+                    del boxes[other_index]
+                    merged = True
+
+                    break
+
+            if merged:
+                break
+
+    return sorted(boxes, key=lambda box: (box[1], box[0]))
+
 # Format a duration.
 def format_duration(seconds: float):
     parts = []
@@ -0,0 +1,56 @@
+from pathlib import Path
+from time import time
+import click
+
+from dekun.core.dataset import Dataset
+
+# The dataset command group.
+@click.group("dataset")
+def dataset_command():
+    pass
+
+# Cache the fitted tensors of a dataset.
+@click.command("cache")
+@click.argument("path", type=click.Path(True, file_okay=False))
+@click.option("-w", "--width", type=click.INT, default=512)
+@click.option("-h", "--height", type=click.INT, default=512)
+@click.option("-W", "--workers", type=click.INT, default=4)
+def cache_command(path: str, width: int, height: int, workers: int):
+    from dekun.core.utils import format_duration
+    from dekun.core.cache import TensorCache
+
+    start = time()
+    cache = TensorCache(Dataset(Path(path)), width, height)
+    rebuilt = cache.update(workers)
+
+    parts = [
+        f"Entries: {len(cache.entries)}",
+        f"Rebuilt: {rebuilt}",
+        f"Duration: {format_duration(time() - start)}"
+    ]
+
+    print(" | ".join(f"{part: <20}" for part in parts))
+
+# Pack a dataset into sequential tar shards.
+@click.command("pack")
+@click.argument("path", type=click.Path(True, file_okay=False))
+@click.option("-o", "--output", type=click.Path(file_okay=False), required=1)
+@click.option("-s", "--shard-size", type=click.INT, default=256)
+def pack_command(path: str, output: str, shard_size: int):
+    from dekun.core.utils import format_duration
+    from dekun.core.pack import pack_dataset
+
+    start = time()
+    shards = pack_dataset(Dataset(Path(path)), Path(output), shard_size * 1024 * 1024)
+
+    parts = [
+        f"Entries: {sum(shard['entries'] for shard in shards)}",
+        f"Shards: {len(shards)}",
+        f"Size: {sum(shard['size'] for shard in shards) / (1024 * 1024):.1f} MiB",
+        f"Duration: {format_duration(time() - start)}"
+    ]
+
+    print(" | ".join(f"{part: <20}" for part in parts))
+
+dataset_command.add_command(cache_command)
+dataset_command.add_command(pack_command)
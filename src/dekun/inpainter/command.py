@@ -1,13 +1,13 @@
+from typing import Union
 from pathlib import Path
 from math import ceil
-import torchvision
-import torch
 import click
 
-from dekun.core.utils import TrainProgress, format_duration, average_difference
-from dekun.inpainter.model import Inpainter
+from dekun.core.checkpoint import Checkpointer, load_metadata
 from dekun.core.dataset import Dataset
 
+# The heavy dependencies (torch, torchvision and the model) are imported inside the commands, so the CLI starts fast.
+
 # The inpainter command group.
 @click.group("inpainter")
 def inpainter_command():
@@ -19,6 +19,8 @@ def inpainter_command():
 @click.option("-w", "--width", type=click.INT, default=512)
 @click.option("-h", "--height", type=click.INT, default=512)
 def init_command(path: str, width: int, height: int):
+    from dekun.inpainter.model import Inpainter
+
     processed_path = Path(path).with_suffix(".pth")
 
     if processed_path.exists():
@@ -30,11 +32,11 @@ def init_command(path: str, width: int, height: int):
 @click.command("info")
 @click.argument("path", type=click.Path(True))
 def info_command(path: str):
-    data = torch.load(str(Path(path)), "cpu")
+    data = load_metadata(Path(path))
 
     print(f"Width: {data['width']}")
     print(f"Height: {data['height']}")
-    print(f"Height: {data['depth']}")
+    print(f"Precision: {data.get('precision', 'fp32')}")
     print(f"Loss: {data['loss']}")
     print(f"Iterations: {data['iterations']}")
 
@@ -44,26 +46,89 @@ def info_command(path: str):
 @click.option("-i", "--image", type=click.Path(True, dir_okay=False), required=1)
 @click.option("-m", "--mask", type=click.Path(True, dir_okay=False), required=1)
 @click.option("-o", "--output", type=click.Path(False, dir_okay=False), default="output.jpg")
+@click.option("-M", "--mode", type=click.Choice(["fit", "tile", "region"]), default="fit")
+@click.option("-T", "--tile-size", type=click.INT, default=512)
+@click.option("-O", "--tile-overlap", type=click.INT, default=64)
+@click.option("-R", "--region-margin", type=click.INT, default=32)
+@click.option("-s", "--batch-size", type=click.INT, default=4)
+@click.option("-P", "--precision", type=click.Choice(["fp32", "bf16", "fp16"]))
+@click.option("-C", "--compile", is_flag=True)
 @click.option("-D", "--device", type=click.Choice(["auto", "cpu", "cuda"]), default="auto")
-def inpaint_command(path: str, image: str, mask: str, output: str, device: str):
-    inpainter = Inpainter.load(device, Path(path))
+def inpaint_command(path: str, image: str, mask: str, output: str, mode: str, tile_size: int, tile_overlap: int, region_margin: int, batch_size: int, precision: Union[str, None], compile: bool, device: str):
+    from dekun.inpainter.model import Inpainter
+    import torchvision
 
-    output_image = inpainter.inpaint(
-        torchvision.io.decode_image(image, torchvision.io.ImageReadMode.RGB).float() / 255,
-        torchvision.io.decode_image(mask, torchvision.io.ImageReadMode.GRAY).float() / 255
-    )
+    inpainter = Inpainter.load(device, Path(path), precision)
+
+    if compile:
+        inpainter.compile(Path(path))
+
+    image_tensor = torchvision.io.decode_image(image, torchvision.io.ImageReadMode.RGB).float() / 255
+    mask_tensor = torchvision.io.decode_image(mask, torchvision.io.ImageReadMode.GRAY).float() / 255
+
+    if mode == "fit":
+        output_image = inpainter.inpaint(image_tensor, mask_tensor)
+    elif mode == "tile":
+        output_image = inpainter.inpaint_tiled(image_tensor, mask_tensor, tile_size, tile_overlap, batch_size)
+    else:
+        output_image = inpainter.inpaint_regions(image_tensor, mask_tensor, region_margin, batch_size)
 
     torchvision.utils.save_image(output_image.squeeze(0), output)
 
+# Export a inpainter for inference only.
+@click.command("export")
+@click.argument("path", type=click.Path(True, dir_okay=False))
+@click.option("-o", "--output", type=click.Path(False, dir_okay=False))
+@click.option("-H", "--half", is_flag=True)
+def export_command(path: str, output: Union[str, None], half: bool):
+    from dekun.inpainter.model import Inpainter
+
+    processed_path = Path(path)
+
+    Inpainter.load("cpu", processed_path, training=True).export(processed_path.with_name(f"{processed_path.stem}-inference.pth") if output == None else Path(output), half)
+
 # Train a generator.
 @click.command("train")
 @click.argument("path", type=click.Path(True))
 @click.option("-d", "--dataset", type=click.Path(True, file_okay=False), required=1)
 @click.option("-i", "--iterations", type=click.INT)
 @click.option("-t", "--threshold", type=click.FLOAT)
+@click.option("-c", "--cache", is_flag=True)
+@click.option("-s", "--batch-size", type=click.INT)
+@click.option("-w", "--workers", type=click.INT)
+@click.option("-p", "--prefetch", type=click.INT)
+@click.option("-a", "--accumulation", type=click.INT)
+@click.option("-A", "--auto-batch", is_flag=True)
+@click.option("-M", "--max-batch-size", type=click.INT, default=256)
+@click.option("-f", "--flip", type=click.FLOAT)
+@click.option("-r", "--crop", type=click.FLOAT)
+@click.option("-b", "--bucket/--no-bucket", default=None)
+@click.option("-L", "--log-steps", type=click.INT)
+@click.option("-R", "--profile", type=click.INT)
+@click.option("-S", "--save-steps", type=click.INT)
+@click.option("-T", "--save-interval", type=click.FLOAT)
+@click.option("-k", "--keep", type=click.INT, default=1)
+@click.option("-P", "--precision", type=click.Choice(["fp32", "bf16", "fp16"]))
 @click.option("-D", "--device", type=click.Choice(["auto", "cpu", "cuda"]), default="auto")
-def train_command(path: str, dataset: str, iterations: int, threshold: float, device: str):
-    inpainter = Inpainter.load(device, Path(path))
+def train_command(path: str, dataset: str, iterations: int, threshold: float, cache: bool, batch_size: Union[int, None], workers: Union[int, None], prefetch: Union[int, None], accumulation: Union[int, None], auto_batch: bool, max_batch_size: int, flip: Union[float, None], crop: Union[float, None], bucket: Union[bool, None], log_steps: Union[int, None], profile: Union[int, None], save_steps: Union[int, None], save_interval: Union[float, None], keep: int, precision: Union[str, None], device: str):
+    from dekun.core.utils import TrainProgress, StepProgress, format_duration, average_difference
+    from dekun.core.profiler import Profiler
+    from dekun.core.distributed import init_distributed, cleanup_distributed, is_main_process
+    from dekun.core.pack import Pack, is_packed
+    from dekun.inpainter.model import Inpainter
+
+    init_distributed(device)
+
+    inpainter = Inpainter.load(device, Path(path), precision, training=True)
+    inpainter.configure_training(
+        inpainter.batch_size if batch_size == None else batch_size,
+        inpainter.workers if workers == None else workers,
+        inpainter.prefetch if prefetch == None else prefetch,
+        inpainter.accumulation if accumulation == None else accumulation,
+        inpainter.preprocessor.flip if flip == None else flip,
+        inpainter.preprocessor.crop if crop == None else crop,
+        (inpainter.preprocessor.buckets != None) if bucket == None else bucket
+    )
 
     duration_history = []
     loss_history = []
@@ -111,6 +176,22 @@ def train_command(path: str, dataset: str, iterations: int, threshold: float, de
 
         return False
 
+    # The training step callback.
+    def step_callback(progress: StepProgress):
+        if log_steps == None or (progress.step % log_steps != 0 and progress.step != progress.steps):
+            return
+
+        parts = [
+            f"Step: {progress.step}/{progress.steps}",
+            f"Loss: {progress.loss:.5f}",
+            f"Speed: {progress.samples_per_second():.2f} samples/s",
+            f"Data: {progress.data_time * 1000:.0f}ms",
+            f"Compute: {progress.compute_time * 1000:.0f}ms",
+            f"Memory: {'unknown' if progress.peak_memory == None else f'{progress.peak_memory / (1024 ** 2):.0f} MiB'}"
+        ]
+
+        print(" | ".join(f"{part: <20}" for part in parts))
+
     if (iterations == None or inpainter.iterations >= iterations) and (threshold == None or inpainter.loss <= threshold):
         parts = [
             f"Model Info ({inpainter.width}x{inpainter.height})",
@@ -118,12 +199,40 @@ def train_command(path: str, dataset: str, iterations: int, threshold: float, de
             f"Loss: {inpainter.loss:.5f}"
         ]
 
-        print("Info     |" + " | ".join(f"{part: <20}" for part in parts))
+        if is_main_process():
+            print("Info     |" + " | ".join(f"{part: <20}" for part in parts))
     else:
-        inpainter.train(Dataset(Path(dataset)), train_callback)
-        inpainter.save(Path(path))
+        source = Pack(Path(dataset)) if is_packed(Path(dataset)) else Dataset(Path(dataset))
+
+        if auto_batch:
+            # Create a callback that prints the speed of the candidates.
+            def candidate_callback(kind: str):
+
+                # The candidate callback.
+                def callback(value: int, speed: float):
+                    if is_main_process():
+                        print(" | ".join(f"{part: <20}" for part in [f"{kind}: {value}", f"Speed: {speed:.2f} samples/s"]))
+
+                return callback
+
+            inpainter.auto_batch(source, max_batch_size, candidate_callback("Batch Size"), candidate_callback("Workers"))
+
+            if is_main_process():
+                print(" | ".join(f"{part: <20}" for part in [f"Batch Size: {inpainter.batch_size}", f"Workers: {inpainter.workers}"]))
+
+        profiler = Profiler(Path(path).with_name(f"{Path(path).stem}.trace.json"), profile, inpainter.device) if profile != None and is_main_process() else None
+
+        checkpointer = Checkpointer(Path(path), save_steps, None if save_interval == None else save_interval * 60, keep)
+
+        inpainter.train(source, train_callback, cache, step_callback, profiler, checkpointer)
+
+        if is_main_process():
+            checkpointer.save(inpainter.save)
+
+    cleanup_distributed()
 
 inpainter_command.add_command(init_command)
 inpainter_command.add_command(info_command)
 inpainter_command.add_command(inpaint_command)
 inpainter_command.add_command(train_command)
+inpainter_command.add_command(export_command)
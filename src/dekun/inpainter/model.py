@@ -1,53 +1,122 @@
 from typing import Union, Callable, Optional
 from pathlib import Path
+from copy import deepcopy
 import torch.nn as nn
 import torch
 import time
 import os
 
 from dekun.core.lama import LaMaGenerator, PatchDiscriminator, VGGFeatureExtractor
-from dekun.core.utils import TrainProgress, resolve_device, fit_tensor
-from dekun.inpainter.loader import Loader
+from dekun.core.utils import TrainProgress, StepProgress, create_position, resume_position, resolve_device, build_model, autocast, trace_model, fit_tensor, unfit_tensor, tile_tensor, mask_regions
+from dekun.core.loader import Loader, PackedLoader
+from dekun.core.distributed import is_main_process, get_rank, get_world_size, get_local_world_size, seed_distributed, wrap_model, accumulate_gradients, broadcast_module, barrier, even_batches, all_reduce_sum, all_reduce_gradients, broadcast_flag
+from dekun.core.checkpoint import Checkpointer
+from dekun.core.sampler import ResumableSampler
+from dekun.core.bucket import BucketSampler, create_buckets
+from dekun.core.preprocess import Preprocessor, collate_samples, apply_masks
+from dekun.core.profiler import StepTimer, Profiler, peak_memory
+from dekun.core.tuning import find_batch_size, find_worker_amount, preserve_buffers
+from dekun.core.fusion import verify_fusion
+from dekun.core.cache import TensorCache
 from dekun.core.dataset import Dataset
+from dekun.core.pack import Pack
 
 CPU_CORES = os.cpu_count()
 WORKER_AMOUNT = 1 if CPU_CORES == None else CPU_CORES // 2
 
+TRAINING_STATES = ["discriminator_state", "generator_optimizer_state", "discriminator_optimizer_state"]
+
 # An inpainter to generator a certain parts of an image.
 class Inpainter:
 
-    # Load a inpainter.
+    # Load a inpainter, the training states are kept memory-mapped until the first training and the generator is fused for inference when not training.
     @staticmethod
-    def load(device: str, path: Path):
-        data = torch.load(str(path), resolve_device(device))
-        inpainter = Inpainter(device, data["width"], data["height"])
+    def load(device: str, path: Path, precision: Union[str, None] = None, training: bool = False):
+        data = torch.load(str(path), "cpu", mmap=True)
+        inpainter = Inpainter(device, data["width"], data["height"], data.get("precision", "fp32") if precision == None else precision, data["generator_state"])
+        inpainter.training_state = {name: data[name] for name in TRAINING_STATES if name in data}
 
-        inpainter.generator.load_state_dict(data["generator_state"])
-        inpainter.discriminator.load_state_dict(data["discriminator_state"])
+        # A disabled scaler saves an empty state, so it is only loaded when the checkpoint was saved with fp16.
+        if len(data.get("scaler_state", {})) > 0 and inpainter.scaler.is_enabled():
+            inpainter.scaler.load_state_dict(data["scaler_state"])
 
-        inpainter.generator_optimizer.load_state_dict(data["generator_optimizer_state"])
-        inpainter.discriminator_optimizer.load_state_dict(data["discriminator_optimizer_state"])
+        inpainter.configure_training(data.get("batch_size", 4), data.get("workers"), data.get("prefetch", 2), data.get("accumulation", 1), data.get("flip", 0.0), data.get("crop", 1.0), data.get("bucket", False))
 
         inpainter.loss = data["loss"]
         inpainter.iterations = data["iterations"]
+        inpainter.position = data.get("position")
+
+        if not training:
+            inpainter.fuse()
 
         return inpainter
 
-    # Initialize a inpainter.
-    def __init__(self, device: str, width: int, height: int):
+    # Initialize a inpainter, the generator is built directly from its state when provided.
+    def __init__(self, device: str, width: int, height: int, precision: str = "fp32", generator_state: Union[dict, None] = None):
         if width < 1:
             raise ValueError(f"Invalid width: {width}")
         if height < 1:
             raise ValueError(f"Invalid height: {height}")
+        if precision not in ["fp32", "bf16", "fp16"]:
+            raise ValueError(f"Unsupported precision: {precision} (fp32|bf16|fp16)")
 
         self.width = width
         self.height = height
+        self.precision = precision
 
         self.loss = 1.0
         self.iterations = 0
 
+        self.batch_size = 4
+        self.workers: Union[int, None] = None
+        self.prefetch = 2
+        self.accumulation = 1
+        self.preprocessor = Preprocessor(width, height)
+
+        self.seed = 0
+        self.position: Union[dict, None] = None
+
         self.device = torch.device(resolve_device(device))
-        self.generator = LaMaGenerator(inp_channels=4, out_channels=3).to(self.device)
+        self.generator = build_model(lambda: LaMaGenerator(inp_channels=4, out_channels=3), self.device, generator_state)
+        self.scaler = torch.amp.GradScaler(self.device.type, enabled=precision == "fp16")
+
+        self.compiled_generator: Union[torch.jit.ScriptModule, None] = None
+
+        self.prepared = False
+        self.training_state = {}
+
+        self.fused = False
+
+        self.discriminator: PatchDiscriminator
+        self.generator_optimizer: torch.optim.Adam
+        self.discriminator_optimizer: torch.optim.Adam
+        self.l1: nn.L1Loss
+        self.vgg: VGGFeatureExtractor
+
+    # Fuse the generator for inference, the generator is kept unfused when the fused generator does not match it.
+    def fuse(self):
+        if self.fused:
+            return
+
+        factor = 2 ** self.generator.down_amount
+        fused = deepcopy(self.generator).fuse_for_inference()
+
+        if not verify_fusion(self.generator, fused, torch.rand((1, 4, factor * 4, factor * 4), device=self.device)):
+            print("The fused generator does not match the generator, falling back to the unfused generator")
+
+            return
+
+        self.generator = fused
+        self.compiled_generator = None
+        self.fused = True
+
+    # Prepare the parts that are only used for training, they are built on the first training so inference never pays for them.
+    def prepare_training(self):
+        if self.fused:
+            raise Exception("Cannot train an inpainter that is fused for inference")
+        if self.prepared:
+            return
+
         self.discriminator = PatchDiscriminator(in_channels=3).to(self.device)
 
         self.generator_optimizer = torch.optim.Adam(self.generator.parameters(), lr=1e-4, betas=(0.5, 0.999))
@@ -56,76 +125,385 @@ class Inpainter:
         self.l1 = nn.L1Loss()
         self.vgg = VGGFeatureExtractor().to(self.device).eval()
 
-    # Train the inpainter.
-    def train(self, dataset: Dataset, train_callback: Union[Callable[[TrainProgress], bool], None] = None):
-        self.generator.train()
-        self.discriminator.train()
+        if "discriminator_state" in self.training_state:
+            self.discriminator.load_state_dict(self.training_state["discriminator_state"])
+        if "generator_optimizer_state" in self.training_state:
+            self.generator_optimizer.load_state_dict(self.training_state["generator_optimizer_state"])
+        if "discriminator_optimizer_state" in self.training_state:
+            self.discriminator_optimizer.load_state_dict(self.training_state["discriminator_optimizer_state"])
+
+        self.prepared = True
+        self.training_state = {}
+
+    # Configure the training, the worker amount is decided by the amount of CPU cores when it is None.
+    def configure_training(self, batch_size: int = 4, workers: Union[int, None] = None, prefetch: int = 2, accumulation: int = 1, flip: float = 0.0, crop: float = 1.0, bucket: bool = False):
+        if batch_size < 1:
+            raise ValueError(f"Invalid batch size: {batch_size}")
+        if workers != None and workers < 0:
+            raise ValueError(f"Invalid worker amount: {workers}")
+        if prefetch < 1:
+            raise ValueError(f"Invalid prefetch factor: {prefetch}")
+        if accumulation < 1:
+            raise ValueError(f"Invalid accumulation steps: {accumulation}")
+
+        self.batch_size = batch_size
+        self.workers = workers
+        self.prefetch = prefetch
+        self.accumulation = accumulation
+        self.preprocessor = Preprocessor(self.width, self.height, flip, crop, create_buckets(self.width, self.height, 2 ** self.generator.down_amount) if bucket else None)
+
+    # Create the data loader for the training.
+    def create_loader(self, dataset: Union[Dataset, Pack], cache: bool = False, workers: Union[int, None] = None):
+        if workers == None:
+            workers = max(1, WORKER_AMOUNT // get_local_world_size()) if self.workers == None else self.workers
+
+        if isinstance(dataset, Pack):
+            if cache:
+                raise ValueError("The tensor cache does not support packed datasets")
+            if self.preprocessor.buckets != None:
+                raise ValueError("Bucketing does not support packed datasets")
+
+            source = PackedLoader(dataset)
+            resumable = source
+        else:
+            tensor_cache = None
+
+            if cache and self.preprocessor.buckets != None:
+                raise ValueError("The tensor cache does not support bucketing")
+
+            if cache:
+                tensor_cache = TensorCache(dataset, self.width, self.height)
+
+                if is_main_process():
+                    tensor_cache.update(max(1, workers))
+
+                barrier()
+
+                if not is_main_process():
+                    tensor_cache = TensorCache(dataset, self.width, self.height)
+
+            source = Loader(dataset, tensor_cache)
+
+            if self.preprocessor.buckets != None:
+                resumable = BucketSampler(dataset, self.preprocessor.buckets, self.batch_size, get_rank(), get_world_size(), self.width / self.height)
+            else:
+                resumable = ResumableSampler(len(source), get_rank(), get_world_size())
 
         loader = torch.utils.data.DataLoader(
-            Loader(dataset, self.width, self.height),
+            source,
 
-            batch_size=4,
-            num_workers=WORKER_AMOUNT,
-            prefetch_factor=2,
+            batch_size=1 if isinstance(resumable, BucketSampler) else self.batch_size,
+            sampler=resumable if isinstance(resumable, ResumableSampler) else None,
+            batch_sampler=resumable if isinstance(resumable, BucketSampler) else None,
+            collate_fn=collate_samples,
+            num_workers=workers,
+            prefetch_factor=self.prefetch if workers > 0 else None,
 
             pin_memory=self.device.type == "cuda"
         )
 
+        return loader, resumable
+
+    # Train the inpainter.
+    def train(self, dataset: Union[Dataset, Pack], train_callback: Union[Callable[[TrainProgress], bool], None] = None, cache: bool = False, step_callback: Union[Callable[[StepProgress], None], None] = None, profiler: Union[Profiler, None] = None, checkpointer: Union[Checkpointer, None] = None):
+        self.prepare_training()
+
+        self.generator.train()
+        self.discriminator.train()
+        self.compiled_generator = None
+
+        # The processes are seeded before the position is resumed, so the random state of the checkpoint is kept.
+        seed_distributed(self.device)
+
+        position = resume_position(self.position, self.batch_size)
+        self.position = None
+
+        self.seed = position["seed"] if position != None else int(torch.randint(0, 2 ** 62, (1,)).item())
+
+        generator = wrap_model(self.generator, self.device)
+        broadcast_module(self.discriminator)
+
+        loader, resumable = self.create_loader(dataset, cache)
+
+        self.discriminator_optimizer.zero_grad()
+        self.generator_optimizer.zero_grad()
+
+        try:
+            self.train_epochs(generator, loader, resumable, position, train_callback, step_callback, profiler, checkpointer)
+        finally:
+            if profiler != None:
+                profiler.stop()
+
+    # Train the inpainter until the callback stops it.
+    def train_epochs(self, generator: nn.Module, loader: torch.utils.data.DataLoader, resumable: Union[ResumableSampler, BucketSampler, PackedLoader], position: Union[dict, None], train_callback: Union[Callable[[TrainProgress], bool], None], step_callback: Union[Callable[[StepProgress], None], None], profiler: Union[Profiler, None], checkpointer: Union[Checkpointer, None]):
+        timer = StepTimer(self.device)
+        updates = 0
+
         while True:
             start = time.time()
-            average = []
-
-            for images, masks, combineds in loader:
-                self.discriminator_optimizer.zero_grad()
-                self.generator_optimizer.zero_grad()
-
-                images = images.to(self.device, non_blocking=True)
-                masks = masks.to(self.device, non_blocking=True)
-                combineds = combineds.to(self.device, non_blocking=True)
-                
-                prediction = self.generator(torch.cat([combineds, masks], dim=1))
-                composite = (prediction * masks) + (combineds * (1 - masks))
-
-                real_output = self.discriminator(images)
-                fake_output = self.discriminator(composite.detach())
-                discriminator_loss = torch.mean(nn.functional.relu(1.0 - real_output)) + torch.mean(nn.functional.relu(1.0 + fake_output))
-                discriminator_loss.backward()
-                self.discriminator_optimizer.step() 
-
-                fake_output = self.discriminator(composite)
-                adversarial_loss = -torch.mean(fake_output)
-                reconstruction_loss = self.reconstruction_loss(prediction, images, masks)
-                perceptual_loss = self.perceptual_loss(prediction * masks + images * (1 - masks), images)
-                generator_loss = reconstruction_loss * 1.0 + adversarial_loss * 0.1 + perceptual_loss * 0.1
-                generator_loss.backward()
-                self.generator_optimizer.step()
-
-                average.append(generator_loss.item())
-
-            self.loss = sum(average) / len(average)
+            step = 0
+            loss_total = 0.0
+            loss_amount = 0
+
+            if position != None:
+                step = position["step"]
+
+                if is_main_process():
+                    loss_total = position["loss_total"]
+                    loss_amount = position["loss_amount"]
+
+                position = None
+
+            resumable.resume(self.seed + self.iterations, step, self.batch_size)
+            steps = step + len(loader)
+
+            for images, image_sizes, masks, mask_sizes in timer.measure(even_batches(loader, self.device)):
+                step += 1
+                sync = step % self.accumulation == 0
+
+                images, masks = self.preprocessor.process(images, image_sizes, masks, mask_sizes, self.device)
+                generator_loss = self.backward(generator, images, masks, apply_masks(images, masks), sync)
+
+                loss_total += generator_loss.item()
+                loss_amount += 1
+
+                if sync:
+                    self.generator_step()
+
+                    updates += 1
+
+                    if checkpointer != None and broadcast_flag(is_main_process() and checkpointer.due(updates), self.device):
+                        self.checkpoint(checkpointer, step, loss_total, loss_amount)
+
+                if profiler != None:
+                    profiler.step()
+
+                if step_callback != None and is_main_process():
+                    data_time, compute_time = timer.finish()
+
+                    step_callback(StepProgress(self.iterations + 1, step, steps, generator_loss.item(), images.shape[0] * get_world_size(), data_time, compute_time, peak_memory(self.device)))
+
+            if step % self.accumulation != 0:
+                self.discriminator_step()
+                all_reduce_gradients(self.generator)
+                self.generator_step()
+
+            total, amount = all_reduce_sum([loss_total, loss_amount], self.device)
+
+            if amount == 0:
+                raise Exception("The epoch ran no training steps, the dataset has fewer entries than the processes and the workers")
+
+            self.loss = total / amount
             self.iterations += 1
 
-            if train_callback == None or not train_callback(TrainProgress(self.iterations, self.loss, round(time.time() - start))):
+            if not broadcast_flag(train_callback != None and is_main_process() and train_callback(TrainProgress(self.iterations, self.loss, round(time.time() - start))), self.device):
                 break
 
+    # Accumulate the gradients of a batch, the discriminator is stepped before the generator loss when the gradients are synchronized.
+    def backward(self, generator: nn.Module, images: torch.Tensor, masks: torch.Tensor, combineds: torch.Tensor, sync: bool):
+        with autocast(self.device, self.precision):
+            prediction = generator(torch.cat([combineds, masks], dim=1)).float()
+            composite = (prediction * masks) + (combineds * (1 - masks))
+
+            real_output = self.discriminator(images).float()
+            fake_output = self.discriminator(composite.detach()).float()
+            discriminator_loss = torch.mean(nn.functional.relu(1.0 - real_output)) + torch.mean(nn.functional.relu(1.0 + fake_output))
+
+        self.scaler.scale(discriminator_loss / self.accumulation).backward()
+
+        if sync:
+            self.discriminator_step()
+
+        # The discriminator is frozen so the generator loss does not leak into its accumulated gradients.
+        self.discriminator.requires_grad_(False)
+
+        try:
+            with accumulate_gradients(generator, sync):
+                with autocast(self.device, self.precision):
+                    fake_output = self.discriminator(composite).float()
+                    adversarial_loss = -torch.mean(fake_output)
+                    reconstruction_loss = self.reconstruction_loss(prediction, images, masks)
+                    perceptual_loss = self.perceptual_loss(prediction * masks + images * (1 - masks), images)
+                    generator_loss = reconstruction_loss * 1.0 + adversarial_loss * 0.1 + perceptual_loss * 0.1
+
+                self.scaler.scale(generator_loss / self.accumulation).backward()
+        finally:
+            self.discriminator.requires_grad_(True)
+
+        return generator_loss
+
+    # Save a checkpoint in the middle of an epoch, the position in the epoch is saved so the training can resume from it.
+    def checkpoint(self, checkpointer: Checkpointer, step: int, loss_total: float, loss_amount: int):
+        loss_total, loss_amount = all_reduce_sum([loss_total, loss_amount], self.device)
+
+        if is_main_process():
+            self.position = create_position(self.seed, step, self.batch_size, loss_total, loss_amount)
+
+            try:
+                checkpointer.save(self.save)
+            finally:
+                self.position = None
+
+    # Step the discriminator with the accumulated gradients.
+    def discriminator_step(self):
+        all_reduce_gradients(self.discriminator)
+
+        self.scaler.step(self.discriminator_optimizer)
+        self.discriminator_optimizer.zero_grad()
+
+    # Step the generator with the accumulated gradients.
+    def generator_step(self):
+        self.scaler.step(self.generator_optimizer)
+        self.scaler.update()
+        self.generator_optimizer.zero_grad()
+
+    # Run a training step on random data without updating the models, used to probe the memory usage and the speed of a batch size.
+    def probe(self, batch_size: int):
+        self.prepare_training()
+
+        self.generator.train()
+        self.discriminator.train()
+
+        images = torch.rand((batch_size, 3, self.height, self.width), device=self.device)
+        masks = (torch.rand((batch_size, 1, self.height, self.width), device=self.device) > 0.5).float()
+
+        try:
+            with preserve_buffers(self.generator, self.discriminator):
+                self.backward(self.generator, images, masks, apply_masks(images, masks), False)
+        finally:
+            self.discriminator_optimizer.zero_grad(set_to_none=True)
+            self.generator_optimizer.zero_grad(set_to_none=True)
+
+    # Find the largest batch size that fits in memory and the worker amount that keeps up with it.
+    def auto_batch(self, dataset: Union[Dataset, Pack], max_batch_size: int = 256, batch_callback: Union[Callable[[int, float], None], None] = None, worker_callback: Union[Callable[[int, float], None], None] = None):
+        batch_size, results = find_batch_size(self.probe, self.device, max_batch_size, callback=batch_callback)
+
+        self.batch_size = batch_size
+        self.workers, _ = find_worker_amount(lambda workers: self.create_loader(dataset, False, workers)[0], batch_size, results[batch_size], CPU_CORES or 1, callback=worker_callback, default=self.workers)
+
+        return self.batch_size, self.workers
+
     # Inpaint an image.
     def inpaint(self, image: torch.Tensor, mask: torch.Tensor):
+        return self.inpaint_batch([image], [mask])[0]
+
+    # Inpaint a batch of images.
+    def inpaint_batch(self, images: list[torch.Tensor], masks: list[torch.Tensor]):
+        if len(images) != len(masks):
+            raise ValueError(f"The amount of images and masks does not match: {len(images)} != {len(masks)}")
+
+        fitted = [fit_tensor(image, self.width, self.height) for image in images]
+        fitted_masks = [fit_tensor(mask, self.width, self.height)[0] for mask in masks]
+
+        return self.inpaint_fitted(torch.stack([item[0] for item in fitted]), torch.stack(fitted_masks), [item[1] for item in fitted], [(image.shape[2], image.shape[1]) for image in images])
+
+    # Inpaint an image with overlapping tiles at its original resolution, only the tiles that intersect the mask are processed.
+    def inpaint_tiled(self, image: torch.Tensor, mask: torch.Tensor, tile: int = 512, overlap: int = 64, batch_size: int = 4):
+        factor = 2 ** self.generator.down_amount
+
+        if tile % factor != 0:
+            raise ValueError(f"Invalid tile size: {tile} (not divisible by {factor})")
+
+        self.generator.eval()
+
+        # Inpaint a batch of tiles.
+        def forward(tiles: torch.Tensor):
+            return torch.clamp(self.forward(tiles.to(self.device)).float(), 0.0, 1.0)
+
+        # Check if a tile intersects the mask.
+        def select(tile: torch.Tensor):
+            return bool((tile[3] > 0.5).any())
+
+        with torch.no_grad(), autocast(self.device, self.precision):
+            output, weight = tile_tensor(torch.cat((image, mask), dim=0), forward, tile, overlap, batch_size, select)
+
+            if output is None:
+                return image.clone()
+
+            binary_mask = ((mask > 0.5) & (weight > 0)).float()
+            output = output / torch.clamp(weight, min=1e-8)
+
+            return (image * (1 - binary_mask)) + (output * binary_mask)
+
+    # Inpaint only the regions around the connected parts of the mask, every crop runs at its own size padded to the stride of the generator and only the crops with the same padded size are batched.
+    def inpaint_regions(self, image: torch.Tensor, mask: torch.Tensor, margin: int = 32, batch_size: int = 4):
+        factor = 2 ** self.generator.down_amount
+        groups: dict[tuple[int, int], list[tuple[int, int, int, int]]] = {}
+
+        for box in mask_regions(mask, margin):
+            width, height = self.region_size(box[2] - box[0], box[3] - box[1])
+            groups.setdefault((-(-width // factor) * factor, -(-height // factor) * factor), []).append(box)
+
+        output = image.clone()
+
+        for (padded_width, padded_height), boxes in groups.items():
+            for index in range(0, len(boxes), batch_size):
+                batch = boxes[index:index + batch_size]
+                images = []
+                masks = []
+                transforms = []
+
+                for left, top, right, bottom in batch:
+                    width, height = self.region_size(right - left, bottom - top)
+                    region_image = image[:, top:bottom, left:right]
+                    region_mask = mask[:, top:bottom, left:right]
+
+                    if width != right - left or height != bottom - top:
+                        region_image = torch.nn.functional.interpolate(region_image.unsqueeze(0), size=(height, width), mode="bilinear", align_corners=False).squeeze(0)
+                        region_mask = torch.nn.functional.interpolate(region_mask.unsqueeze(0), size=(height, width), mode="bilinear", align_corners=False).squeeze(0)
+
+                    images.append(torch.nn.functional.pad(region_image.unsqueeze(0), (0, padded_width - width, 0, padded_height - height), mode="replicate").squeeze(0))
+                    masks.append(torch.nn.functional.pad(region_mask, (0, padded_width - width, 0, padded_height - height)))
+                    transforms.append((0, 0, width, height))
+
+                outputs = self.inpaint_fitted(torch.stack(images), torch.stack(masks), transforms, [(right - left, bottom - top) for left, top, right, bottom in batch])
+
+                for (left, top, right, bottom), region_output in zip(batch, outputs):
+                    binary_mask = mask[:, top:bottom, left:right] > 0.5
+                    output[:, top:bottom, left:right] = torch.where(binary_mask, region_output.cpu(), output[:, top:bottom, left:right])
+
+        return output
+
+    # Get the size a region is inpainted at, the region is only scaled down when it does not fit into the size of the inpainter.
+    def region_size(self, width: int, height: int):
+        scale = min(1.0, self.width / width, self.height / height)
+
+        return max(1, round(width * scale)), max(1, round(height * scale))
+
+    # Inpaint a batch of images that are already fitted into the size of the inpainter.
+    def inpaint_fitted(self, images: torch.Tensor, masks: torch.Tensor, transforms: list[tuple[int, int, int, int]], sizes: list[tuple[int, int]]):
+        if len(images.shape) != 4:
+            raise ValueError(f"Unsupported image tensor shape: {images.shape}")
+        if len(masks.shape) != 4:
+            raise ValueError(f"Unsupported mask tensor shape: {masks.shape}")
+
         self.generator.eval()
 
-        with torch.no_grad():
-            resized_image, transform = fit_tensor(image, self.width, self.height)
-            resized_mask = fit_tensor(mask, self.width, self.height)[0]
- 
-            output = self.generator(torch.cat((resized_image.to(self.device).unsqueeze(0), resized_mask.to(self.device).unsqueeze(0)), dim=1))
-            output = torch.clamp(output, 0.0, 1.0)
+        with torch.no_grad(), autocast(self.device, self.precision):
+            images = images.to(self.device)
+            masks = masks.to(self.device)
+
+            outputs = self.forward(torch.cat((images, masks), dim=1)).float()
+            outputs = torch.clamp(outputs, 0.0, 1.0)
 
-            binary_mask = (resized_mask > 0.5).float()
+            binary_masks = (masks > 0.5).float()
+            outputs = (images * (1 - binary_masks)) + (outputs * binary_masks)
 
-            output = (resized_image * (1 - binary_mask)) + (output * binary_mask)
-            output = output[:, :, transform[1]:transform[1] + transform[3], transform[0]:transform[0] + transform[2]]
-            output = torch.nn.functional.interpolate(output, size=(image.shape[1], image.shape[2])).squeeze(0)
+            return [unfit_tensor(output, transform, size[0], size[1]) for output, transform, size in zip(outputs, transforms, sizes)]
 
-            return output.squeeze(0)
+    # Compile the generator for the size of the inpainter, the compiled generator is cached next to the checkpoint.
+    def compile(self, path: Path):
+        example = torch.zeros((1, 4, self.height, self.width), device=self.device)
+
+        with autocast(self.device, self.precision):
+            self.compiled_generator = trace_model(self.generator, example, path, path.with_name(f"{path.stem}.{self.device.type}.{self.precision}.{self.width}x{self.height}.pt"))
+
+    # Forward the generator, the compiled generator is used when it matches the input size.
+    def forward(self, input: torch.Tensor):
+        if self.compiled_generator is not None and input.shape[2] == self.height and input.shape[3] == self.width:
+            return self.compiled_generator(input)
+
+        return self.generator(input)
 
     # Calculate the reconstruction loss.
     def reconstruction_loss(self, prediction: torch.Tensor, target, mask: Optional[torch.Tensor] = None):
@@ -147,18 +525,61 @@ class Inpainter:
 
         return self.l1(prediction_features, target_features)
 
-    # Save the inpainter.
+    # Save the inpainter, the file is replaced atomically.
     def save(self, path: Path):
+        if self.fused:
+            raise Exception("Cannot save an inpainter that is fused for inference")
+
+        if self.prepared:
+            training_state = {
+                "discriminator_state": self.discriminator.state_dict(),
+
+                "generator_optimizer_state": self.generator_optimizer.state_dict(),
+                "discriminator_optimizer_state": self.discriminator_optimizer.state_dict()
+            }
+        else:
+            training_state = self.training_state
+
+        temporary_path = path.with_name(f".{path.name}.tmp")
+
         torch.save({
             "width": self.width,
             "height": self.height,
+            "precision": self.precision,
 
             "loss": self.loss,
             "iterations": self.iterations,
 
+            "batch_size": self.batch_size,
+            "workers": self.workers,
+            "prefetch": self.prefetch,
+            "accumulation": self.accumulation,
+            "flip": self.preprocessor.flip,
+            "crop": self.preprocessor.crop,
+            "bucket": self.preprocessor.buckets != None,
+
+            "position": self.position,
+
             "generator_state": self.generator.state_dict(),
-            "discriminator_state": self.discriminator.state_dict(),
+            **training_state,
+
+            "scaler_state": self.scaler.state_dict()
+        }, str(temporary_path))
+
+        os.replace(temporary_path, path)
+
+    # Export the generator of the inpainter for inference only.
+    def export(self, path: Path, half: bool = False):
+        if self.fused:
+            raise Exception("Cannot export an inpainter that is fused for inference")
+
+        torch.save({
+            "width": self.width,
+            "height": self.height,
+            "precision": self.precision,
+
+            "loss": self.loss,
+            "iterations": self.iterations,
 
-            "generator_optimizer_state": self.generator_optimizer.state_dict(),
-            "discriminator_optimizer_state": self.discriminator_optimizer.state_dict()
+            "generator_state": {name: tensor.half() if half and tensor.is_floating_point() else tensor for name, tensor in self.generator.state_dict().items()}
         }, str(path))
@@ -1,13 +1,14 @@
+from typing import Union, cast
 from pathlib import Path
-import PIL.Image as pil
 from math import ceil
-import torchvision
-import torch
+from time import time
 import click
 
-from dekun.core.utils import TrainProgress, format_duration, average_difference
+from dekun.core.pipeline import resolve_paths, run_pipeline
+from dekun.core.checkpoint import Checkpointer, load_metadata
 from dekun.core.dataset import Dataset
-from dekun.marker.model import Marker
+
+# The heavy dependencies (torch, torchvision and the model) are imported inside the commands, so the CLI starts fast.
 
 # The marker command group.
 @click.group("marker")
@@ -21,6 +22,8 @@ def marker_command():
 @click.option("-h", "--height", type = click.INT, default = 512)
 @click.option("-d", "--depth", type = click.INT, default = 5)
 def init_command(path: str, width: int, height: int, depth: int):
+    from dekun.marker.model import Marker
+
     processed_path = Path(path).with_suffix(".pth")
 
     if processed_path.exists():
@@ -32,27 +35,96 @@ def init_command(path: str, width: int, height: int, depth: int):
 @click.command("info")
 @click.argument("path", type=click.Path(True))
 def info_command(path: str):
-    data = torch.load(str(Path(path)), "cpu")
+    data = load_metadata(Path(path))
 
     print(f"Width: {data['width']}")
     print(f"Height: {data['height']}")
+    print(f"Precision: {data.get('precision', 'fp32')}")
     print(f"Loss: {data['loss']}")
     print(f"Iterations: {data['iterations']}")
 
-# Mark an image.
+# Mark an image or a batch of images.
 @click.command("mark")
 @click.argument("path", type=click.Path(True))
-@click.option("-i", "--image", type=click.Path(True, dir_okay=False), required=1)
-@click.option("-o", "--output", type=click.Path(False, dir_okay=False), default="output.jpg")
+@click.option("-i", "--image", type=click.Path(True, dir_okay=False))
+@click.option("-b", "--batch", type=click.STRING)
+@click.option("-o", "--output", type=click.Path(False))
+@click.option("-s", "--batch-size", type=click.INT, default=4)
+@click.option("-w", "--workers", type=click.INT, default=4)
+@click.option("-M", "--mode", type=click.Choice(["fit", "tile"]), default="fit")
+@click.option("-T", "--tile-size", type=click.INT, default=512)
+@click.option("-O", "--tile-overlap", type=click.INT, default=64)
+@click.option("-P", "--precision", type=click.Choice(["fp32", "bf16", "fp16"]))
+@click.option("-C", "--compile", is_flag=True)
 @click.option("-D", "--device", type=click.Choice(["auto", "cpu", "cuda"]), default="auto")
-def mark_command(path: str, image: str, output: str, device: str):
-    marker = Marker.load(device, Path(path))
+def mark_command(path: str, image: Union[str, None], batch: Union[str, None], output: Union[str, None], batch_size: int, workers: int, mode: str, tile_size: int, tile_overlap: int, precision: Union[str, None], compile: bool, device: str):
+    if (image == None) == (batch == None):
+        raise click.UsageError("Specify either --image or --batch")
 
-    output_image = marker.mark(
-        torchvision.io.decode_image(image, torchvision.io.ImageReadMode.RGB).float() / 255
-    )
+    from dekun.core.utils import format_duration, fit_tensor
+    from dekun.marker.model import Marker
+    import torchvision
+    import torch
+
+    marker = Marker.load(device, Path(path), precision)
+
+    if compile:
+        marker.compile(Path(path))
+
+    if image != None:
+        image_tensor = torchvision.io.decode_image(image, torchvision.io.ImageReadMode.RGB).float() / 255
+        output_image = marker.mark(image_tensor) if mode == "fit" else marker.mark_tiled(image_tensor, tile_size, tile_overlap, batch_size)
+
+        torchvision.utils.save_image(output_image.squeeze(0), "output.jpg" if output == None else output)
+    else:
+        output_directory = Path("output" if output == None else output)
+        output_directory.mkdir(parents=True, exist_ok=True)
+
+        # Decode and fit an image.
+        def decode(image_path: Path):
+            image_tensor = torchvision.io.decode_image(str(image_path), torchvision.io.ImageReadMode.RGB)
+
+            if mode == "tile":
+                return image_tensor.float() / 255, None, None
+
+            resized_tensor, transform = fit_tensor(image_tensor, marker.width, marker.height)
+
+            return resized_tensor.float() / 255, transform, (image_tensor.shape[2], image_tensor.shape[1])
+
+        # Mark a batch of images.
+        def process(decoded: list[tuple[torch.Tensor, tuple[int, int, int, int], tuple[int, int]]]):
+            if mode == "tile":
+                return [marker.mark_tiled(item[0], tile_size, tile_overlap, batch_size) for item in decoded]
+
+            return marker.mark_fitted(torch.stack([item[0] for item in decoded]), [item[1] for item in decoded], [item[2] for item in decoded])
+
+        # Write a mask.
+        def write(image_path: Path, mask: torch.Tensor):
+            torchvision.utils.save_image(mask, str(output_directory.joinpath(f"{image_path.stem}-mask.png")))
+
+        start = time()
+        amount = run_pipeline(resolve_paths(cast(str, batch)), decode, process, write, batch_size, workers)
+        duration = time() - start
+
+        parts = [
+            f"Images: {amount}",
+            f"Duration: {format_duration(duration)}",
+            f"Speed: {amount / duration:.2f} images/s"
+        ]
+
+        print(" | ".join(f"{part: <20}" for part in parts))
 
-    torchvision.utils.save_image(output_image.squeeze(0), output)
+# Export a marker for inference only.
+@click.command("export")
+@click.argument("path", type=click.Path(True, dir_okay=False))
+@click.option("-o", "--output", type=click.Path(False, dir_okay=False))
+@click.option("-H", "--half", is_flag=True)
+def export_command(path: str, output: Union[str, None], half: bool):
+    from dekun.marker.model import Marker
+
+    processed_path = Path(path)
+
+    Marker.load("cpu", processed_path, training=True).export(processed_path.with_name(f"{processed_path.stem}-inference.pth") if output == None else Path(output), half)
 
 # Train a marker.
 @click.command("train")
@@ -60,9 +132,42 @@ def mark_command(path: str, image: str, output: str, device: str):
 @click.option("-d", "--dataset", type=click.Path(True, file_okay=False), required=1)
 @click.option("-i", "--iterations", type=click.INT)
 @click.option("-t", "--threshold", type=click.FLOAT)
+@click.option("-c", "--cache", is_flag=True)
+@click.option("-s", "--batch-size", type=click.INT)
+@click.option("-w", "--workers", type=click.INT)
+@click.option("-p", "--prefetch", type=click.INT)
+@click.option("-a", "--accumulation", type=click.INT)
+@click.option("-A", "--auto-batch", is_flag=True)
+@click.option("-M", "--max-batch-size", type=click.INT, default=256)
+@click.option("-f", "--flip", type=click.FLOAT)
+@click.option("-r", "--crop", type=click.FLOAT)
+@click.option("-b", "--bucket/--no-bucket", default=None)
+@click.option("-L", "--log-steps", type=click.INT)
+@click.option("-R", "--profile", type=click.INT)
+@click.option("-S", "--save-steps", type=click.INT)
+@click.option("-T", "--save-interval", type=click.FLOAT)
+@click.option("-k", "--keep", type=click.INT, default=1)
+@click.option("-P", "--precision", type=click.Choice(["fp32", "bf16", "fp16"]))
 @click.option("-D", "--device", type=click.Choice(["auto", "cpu", "cuda"]), default="auto")
-def train_command(path: str, dataset: str, iterations: int, threshold: float, device: str):
-    marker = Marker.load(device, Path(path))
+def train_command(path: str, dataset: str, iterations: int, threshold: float, cache: bool, batch_size: Union[int, None], workers: Union[int, None], prefetch: Union[int, None], accumulation: Union[int, None], auto_batch: bool, max_batch_size: int, flip: Union[float, None], crop: Union[float, None], bucket: Union[bool, None], log_steps: Union[int, None], profile: Union[int, None], save_steps: Union[int, None], save_interval: Union[float, None], keep: int, precision: Union[str, None], device: str):
+    from dekun.core.utils import TrainProgress, StepProgress, format_duration, average_difference
+    from dekun.core.profiler import Profiler
+    from dekun.core.distributed import init_distributed, cleanup_distributed, is_main_process
+    from dekun.core.pack import Pack, is_packed
+    from dekun.marker.model import Marker
+
+    init_distributed(device)
+
+    marker = Marker.load(device, Path(path), precision, training=True)
+    marker.configure_training(
+        marker.batch_size if batch_size == None else batch_size,
+        marker.workers if workers == None else workers,
+        marker.prefetch if prefetch == None else prefetch,
+        marker.accumulation if accumulation == None else accumulation,
+        marker.preprocessor.flip if flip == None else flip,
+        marker.preprocessor.crop if crop == None else crop,
+        (marker.preprocessor.buckets != None) if bucket == None else bucket
+    )
 
     duration_history = []
     loss_history = []
@@ -108,18 +213,62 @@ def train_command(path: str, dataset: str, iterations: int, threshold: float, de
 
         return False
 
+    # The training step callback.
+    def step_callback(progress: StepProgress):
+        if log_steps == None or (progress.step % log_steps != 0 and progress.step != progress.steps):
+            return
+
+        parts = [
+            f"Step: {progress.step}/{progress.steps}",
+            f"Loss: {progress.loss:.5f}",
+            f"Speed: {progress.samples_per_second():.2f} samples/s",
+            f"Data: {progress.data_time * 1000:.0f}ms",
+            f"Compute: {progress.compute_time * 1000:.0f}ms",
+            f"Memory: {'unknown' if progress.peak_memory == None else f'{progress.peak_memory / (1024 ** 2):.0f} MiB'}"
+        ]
+
+        print(" | ".join(f"{part: <20}" for part in parts))
+
     if (iterations == None or marker.iterations >= iterations) and (threshold == None or marker.loss <= threshold):
         parts = [
             f"Iteration: {marker.iterations}",
             f"Loss: {marker.loss:.5f}"
         ]
 
-        print("Info     |" + " | ".join(f"{part: <20}" for part in parts))
+        if is_main_process():
+            print("Info     |" + " | ".join(f"{part: <20}" for part in parts))
     else:
-        marker.train(Dataset(Path(dataset)), train_callback)
-        marker.save(Path(path))
+        source = Pack(Path(dataset)) if is_packed(Path(dataset)) else Dataset(Path(dataset))
+
+        if auto_batch:
+            # Create a callback that prints the speed of the candidates.
+            def candidate_callback(kind: str):
+
+                # The candidate callback.
+                def callback(value: int, speed: float):
+                    if is_main_process():
+                        print(" | ".join(f"{part: <20}" for part in [f"{kind}: {value}", f"Speed: {speed:.2f} samples/s"]))
+
+                return callback
+
+            marker.auto_batch(source, max_batch_size, candidate_callback("Batch Size"), candidate_callback("Workers"))
+
+            if is_main_process():
+                print(" | ".join(f"{part: <20}" for part in [f"Batch Size: {marker.batch_size}", f"Workers: {marker.workers}"]))
+
+        profiler = Profiler(Path(path).with_name(f"{Path(path).stem}.trace.json"), profile, marker.device) if profile != None and is_main_process() else None
+
+        checkpointer = Checkpointer(Path(path), save_steps, None if save_interval == None else save_interval * 60, keep)
+
+        marker.train(source, train_callback, cache, step_callback, profiler, checkpointer)
+
+        if is_main_process():
+            checkpointer.save(marker.save)
+
+    cleanup_distributed()
 
 marker_command.add_command(init_command)
 marker_command.add_command(info_command)
 marker_command.add_command(mark_command)
 marker_command.add_command(train_command)
+marker_command.add_command(export_command)
@@ -1,12 +1,24 @@
-from typing import Union, Callable
+from typing import Union, Callable, cast
 from os import cpu_count
+from copy import deepcopy
 from pathlib import Path
 from time import time
+import os
 import torch
 
-from dekun.core.utils import TrainProgress, resolve_device, fit_tensor
+from dekun.core.utils import TrainProgress, StepProgress, create_position, resume_position, resolve_device, build_model, autocast, trace_model, fit_tensor, unfit_tensor, tile_tensor
+from dekun.core.distributed import is_main_process, get_rank, get_world_size, get_local_world_size, seed_distributed, wrap_model, accumulate_gradients, barrier, even_batches, all_reduce_sum, all_reduce_gradients, broadcast_flag
+from dekun.core.checkpoint import Checkpointer
+from dekun.core.sampler import ResumableSampler
+from dekun.core.bucket import BucketSampler, create_buckets
+from dekun.core.preprocess import Preprocessor, collate_samples
+from dekun.core.profiler import StepTimer, Profiler, peak_memory
+from dekun.core.tuning import find_batch_size, find_worker_amount, preserve_buffers
+from dekun.core.fusion import verify_fusion
+from dekun.core.cache import TensorCache
 from dekun.core.dataset import Dataset
-from dekun.marker.loader import Loader
+from dekun.core.pack import Pack
+from dekun.core.loader import Loader, PackedLoader
 from dekun.core.unet import UNet
 
 CPU_CORES = cpu_count()
@@ -15,102 +27,395 @@ WORKER_AMOUNT = 1 if CPU_CORES == None else CPU_CORES // 2
 # A marker to mark a certain parts of an image.
 class Marker:
 
-    # Load a marker.
+    # Load a marker, an exported marker starts with a fresh optimizer and the model is fused for inference when not training.
     @staticmethod
-    def load(device: str, path: Path):
+    def load(device: str, path: Path, precision: Union[str, None] = None, training: bool = False):
         data = torch.load(str(path), resolve_device(device))
-        marker = Marker(device, data["width"], data["height"], data["depth"])
+        marker = Marker(device, data["width"], data["height"], data["depth"], data.get("precision", "fp32") if precision == None else precision, data["model_state"])
 
-        marker.model.load_state_dict(data["model_state"])
-        marker.optimizer.load_state_dict(data["optimizer_state"])
+        if "optimizer_state" in data:
+            marker.optimizer.load_state_dict(data["optimizer_state"])
+
+        # A disabled scaler saves an empty state, so it is only loaded when the checkpoint was saved with fp16.
+        if len(data.get("scaler_state", {})) > 0 and marker.scaler.is_enabled():
+            marker.scaler.load_state_dict(data["scaler_state"])
+
+        marker.configure_training(data.get("batch_size", 4), data.get("workers"), data.get("prefetch", 2), data.get("accumulation", 1), data.get("flip", 0.0), data.get("crop", 1.0), data.get("bucket", False))
 
         marker.loss = data["loss"]
         marker.iterations = data["iterations"]
+        marker.position = data.get("position")
+
+        if not training:
+            marker.fuse()
 
         return marker
 
-    # Initialize a marker.
-    def __init__(self, device: str, width: int, height: int, depth: int = 5):
+    # Initialize a marker, the model is built directly from its state when provided.
+    def __init__(self, device: str, width: int, height: int, depth: int = 5, precision: str = "fp32", model_state: Union[dict, None] = None):
         if width < 1:
             raise ValueError(f"Invalid width: {width}")
         if height < 1:
             raise ValueError(f"Invalid height: {height}")
+        if precision not in ["fp32", "bf16", "fp16"]:
+            raise ValueError(f"Unsupported precision: {precision} (fp32|bf16|fp16)")
 
         self.device = torch.device(resolve_device(device))
-        self.model = UNet(3, 1, depth).to(self.device)
+        self.model = build_model(lambda: UNet(3, 1, depth), self.device, model_state)
 
         self.width = width
         self.height = height
         self.depth = depth
+        self.precision = precision
 
         self.loss = 1.0
         self.iterations = 0
 
+        self.batch_size = 4
+        self.workers: Union[int, None] = None
+        self.prefetch = 2
+        self.accumulation = 1
+        self.preprocessor = Preprocessor(width, height)
+
+        self.seed = 0
+        self.position: Union[dict, None] = None
+
         self.criterion = torch.nn.BCEWithLogitsLoss()
         self.optimizer = torch.optim.Adam(self.model.parameters(), lr = 1e-4)
+        self.scaler = torch.amp.GradScaler(self.device.type, enabled=precision == "fp16")
 
-    # Train the marker.
-    def train(self, dataset: Dataset, callback: Union[Callable[[TrainProgress], bool], None] = None):
-        self.model.train() 
+        self.compiled_model: Union[torch.jit.ScriptModule, None] = None
+        self.fused = False
+
+    # Fuse the model for inference, the model is kept unfused when the fused model does not match it.
+    def fuse(self):
+        if self.fused:
+            return
+
+        factor = 2 ** self.depth
+        fused = deepcopy(self.model).fuse_for_inference()
+
+        if not verify_fusion(self.model, fused, torch.rand((1, 3, factor * 2, factor * 2), device=self.device)):
+            print("The fused model does not match the model, falling back to the unfused model")
+
+            return
+
+        self.model = fused
+        self.compiled_model = None
+        self.fused = True
+
+    # Configure the training, the worker amount is decided by the amount of CPU cores when it is None.
+    def configure_training(self, batch_size: int = 4, workers: Union[int, None] = None, prefetch: int = 2, accumulation: int = 1, flip: float = 0.0, crop: float = 1.0, bucket: bool = False):
+        if batch_size < 1:
+            raise ValueError(f"Invalid batch size: {batch_size}")
+        if workers != None and workers < 0:
+            raise ValueError(f"Invalid worker amount: {workers}")
+        if prefetch < 1:
+            raise ValueError(f"Invalid prefetch factor: {prefetch}")
+        if accumulation < 1:
+            raise ValueError(f"Invalid accumulation steps: {accumulation}")
+
+        self.batch_size = batch_size
+        self.workers = workers
+        self.prefetch = prefetch
+        self.accumulation = accumulation
+        self.preprocessor = Preprocessor(self.width, self.height, flip, crop, create_buckets(self.width, self.height, 2 ** self.depth) if bucket else None)
+
+    # Create the data loader for the training.
+    def create_loader(self, dataset: Union[Dataset, Pack], cache: bool = False, workers: Union[int, None] = None):
+        if workers == None:
+            workers = max(1, WORKER_AMOUNT // get_local_world_size()) if self.workers == None else self.workers
+
+        if isinstance(dataset, Pack):
+            if cache:
+                raise ValueError("The tensor cache does not support packed datasets")
+            if self.preprocessor.buckets != None:
+                raise ValueError("Bucketing does not support packed datasets")
+
+            source = PackedLoader(dataset)
+            resumable = source
+        else:
+            tensor_cache = None
+
+            if cache and self.preprocessor.buckets != None:
+                raise ValueError("The tensor cache does not support bucketing")
+
+            if cache:
+                tensor_cache = TensorCache(dataset, self.width, self.height)
+
+                if is_main_process():
+                    tensor_cache.update(max(1, workers))
+
+                barrier()
+
+                if not is_main_process():
+                    tensor_cache = TensorCache(dataset, self.width, self.height)
+
+            source = Loader(dataset, tensor_cache)
+
+            if self.preprocessor.buckets != None:
+                resumable = BucketSampler(dataset, self.preprocessor.buckets, self.batch_size, get_rank(), get_world_size(), self.width / self.height)
+            else:
+                resumable = ResumableSampler(len(source), get_rank(), get_world_size())
 
         loader = torch.utils.data.DataLoader(
-            Loader(dataset, self.width, self.height),
+            source,
 
-            batch_size=4,
-            num_workers=WORKER_AMOUNT,
-            prefetch_factor=2,
+            batch_size=1 if isinstance(resumable, BucketSampler) else self.batch_size,
+            sampler=resumable if isinstance(resumable, ResumableSampler) else None,
+            batch_sampler=resumable if isinstance(resumable, BucketSampler) else None,
+            collate_fn=collate_samples,
+            num_workers=workers,
+            prefetch_factor=self.prefetch if workers > 0 else None,
 
             pin_memory=self.device.type == "cuda"
         )
 
+        return loader, resumable
+
+    # Train the marker.
+    def train(self, dataset: Union[Dataset, Pack], callback: Union[Callable[[TrainProgress], bool], None] = None, cache: bool = False, step_callback: Union[Callable[[StepProgress], None], None] = None, profiler: Union[Profiler, None] = None, checkpointer: Union[Checkpointer, None] = None):
+        if self.fused:
+            raise Exception("Cannot train a marker that is fused for inference")
+
+        self.model.train() 
+        self.compiled_model = None
+
+        # The processes are seeded before the position is resumed, so the random state of the checkpoint is kept.
+        seed_distributed(self.device)
+
+        position = resume_position(self.position, self.batch_size)
+        self.position = None
+
+        self.seed = position["seed"] if position != None else int(torch.randint(0, 2 ** 62, (1,)).item())
+
+        model = wrap_model(self.model, self.device)
+        loader, resumable = self.create_loader(dataset, cache)
+
+        self.optimizer.zero_grad()
+
+        try:
+            self.train_epochs(model, loader, resumable, position, callback, step_callback, profiler, checkpointer)
+        finally:
+            if profiler != None:
+                profiler.stop()
+
+    # Train the marker until the callback stops it.
+    def train_epochs(self, model: torch.nn.Module, loader: torch.utils.data.DataLoader, resumable: Union[ResumableSampler, BucketSampler, PackedLoader], position: Union[dict, None], callback: Union[Callable[[TrainProgress], bool], None], step_callback: Union[Callable[[StepProgress], None], None], profiler: Union[Profiler, None], checkpointer: Union[Checkpointer, None]):
+        timer = StepTimer(self.device)
+        updates = 0
+
         while True:
             start = time()
-            average = []
+            step = 0
+            loss_total = 0.0
+            loss_amount = 0
+
+            if position != None:
+                step = position["step"]
+
+                if is_main_process():
+                    loss_total = position["loss_total"]
+                    loss_amount = position["loss_amount"]
+
+                position = None
+
+            resumable.resume(self.seed + self.iterations, step, self.batch_size)
+            steps = step + len(loader)
+
+            for images, image_sizes, masks, mask_sizes in timer.measure(even_batches(loader, self.device)):
+                step += 1
+                sync = step % self.accumulation == 0
+
+                images, masks = self.preprocessor.process(images, image_sizes, masks, mask_sizes, self.device)
+
+                with accumulate_gradients(model, sync):
+                    with autocast(self.device, self.precision):
+                        predictions = model(images)
+                        loss = self.criterion(predictions.float(), masks)
+
+                    self.scaler.scale(loss / self.accumulation).backward()
+
+                loss_total += loss.item()
+                loss_amount += 1
+
+                if sync:
+                    self.optimizer_step()
 
-            for images, masks in loader:
-                self.optimizer.zero_grad()
+                    updates += 1
 
-                images = images.to(self.device, non_blocking=True)
-                masks = masks.to(self.device, non_blocking=True)
-                
-                predictions = self.model(images)
-                loss = self.criterion(predictions, masks)
+                    if checkpointer != None and broadcast_flag(is_main_process() and checkpointer.due(updates), self.device):
+                        self.checkpoint(checkpointer, step, loss_total, loss_amount)
 
-                self.optimizer.zero_grad()
-                loss.backward()
-                self.optimizer.step()
+                if profiler != None:
+                    profiler.step()
 
-                average.append(loss.item())
+                if step_callback != None and is_main_process():
+                    data_time, compute_time = timer.finish()
 
-            self.loss = sum(average) / len(average)
+                    step_callback(StepProgress(self.iterations + 1, step, steps, loss.item(), images.shape[0] * get_world_size(), data_time, compute_time, peak_memory(self.device)))
+
+            if step % self.accumulation != 0:
+                all_reduce_gradients(self.model)
+                self.optimizer_step()
+
+            total, amount = all_reduce_sum([loss_total, loss_amount], self.device)
+
+            if amount == 0:
+                raise Exception("The epoch ran no training steps, the dataset has fewer entries than the processes and the workers")
+
+            self.loss = total / amount
             self.iterations += 1
 
-            if callback == None or not callback(TrainProgress(self.iterations, self.loss, round(time() - start))):
+            if not broadcast_flag(callback != None and is_main_process() and callback(TrainProgress(self.iterations, self.loss, round(time() - start))), self.device):
                 break
 
+    # Save a checkpoint in the middle of an epoch, the position in the epoch is saved so the training can resume from it.
+    def checkpoint(self, checkpointer: Checkpointer, step: int, loss_total: float, loss_amount: int):
+        loss_total, loss_amount = all_reduce_sum([loss_total, loss_amount], self.device)
+
+        if is_main_process():
+            self.position = create_position(self.seed, step, self.batch_size, loss_total, loss_amount)
+
+            try:
+                checkpointer.save(self.save)
+            finally:
+                self.position = None
+
+    # Step the optimizer with the accumulated gradients.
+    def optimizer_step(self):
+        self.scaler.step(self.optimizer)
+        self.scaler.update()
+        self.optimizer.zero_grad()
+
+    # Run a training step on random data without updating the model, used to probe the memory usage and the speed of a batch size.
+    def probe(self, batch_size: int):
+        if self.fused:
+            raise Exception("Cannot train a marker that is fused for inference")
+
+        self.model.train()
+
+        images = torch.rand((batch_size, 3, self.height, self.width), device=self.device)
+        masks = (torch.rand((batch_size, 1, self.height, self.width), device=self.device) > 0.5).float()
+
+        with preserve_buffers(self.model):
+            try:
+                with autocast(self.device, self.precision):
+                    loss = self.criterion(self.model(images).float(), masks)
+
+                self.scaler.scale(loss).backward()
+            finally:
+                self.optimizer.zero_grad(set_to_none=True)
+
+    # Find the largest batch size that fits in memory and the worker amount that keeps up with it.
+    def auto_batch(self, dataset: Union[Dataset, Pack], max_batch_size: int = 256, batch_callback: Union[Callable[[int, float], None], None] = None, worker_callback: Union[Callable[[int, float], None], None] = None):
+        batch_size, results = find_batch_size(self.probe, self.device, max_batch_size, callback=batch_callback)
+
+        self.batch_size = batch_size
+        self.workers, _ = find_worker_amount(lambda workers: self.create_loader(dataset, False, workers)[0], batch_size, results[batch_size], CPU_CORES or 1, callback=worker_callback, default=self.workers)
+
+        return self.batch_size, self.workers
+
     # Mark an image.
     def mark(self, image: torch.Tensor):
+        return self.mark_batch([image])[0]
+
+    # Mark a batch of images.
+    def mark_batch(self, images: list[torch.Tensor]):
+        fitted = [fit_tensor(image, self.width, self.height) for image in images]
+
+        return self.mark_fitted(torch.stack([item[0] for item in fitted]), [item[1] for item in fitted], [(image.shape[2], image.shape[1]) for image in images])
+
+    # Mark an image with overlapping tiles at its original resolution.
+    def mark_tiled(self, image: torch.Tensor, tile: int = 512, overlap: int = 64, batch_size: int = 4):
+        factor = 2 ** self.depth
+
+        if tile % factor != 0:
+            raise ValueError(f"Invalid tile size: {tile} (not divisible by {factor})")
+
         self.model.eval()
 
-        with torch.no_grad():
-            resized_tensor, transform = fit_tensor(image, self.width, self.height)
+        # Mark a batch of tiles.
+        def forward(tiles: torch.Tensor):
+            return torch.sigmoid(self.forward(tiles.to(self.device)).float())
 
-            output = self.model(resized_tensor.to(self.device).unsqueeze(0))
-            output = output[:, :, transform[1]:transform[1] + transform[3], transform[0]:transform[0] + transform[2]]
-            output = torch.nn.functional.interpolate(output, size=(image.shape[1], image.shape[2])).squeeze(0).squeeze()
+        with torch.no_grad(), autocast(self.device, self.precision):
+            output, weight = tile_tensor(image, forward, tile, overlap, batch_size)
 
-            return torch.sigmoid(output)
+            return (cast(torch.Tensor, output) / weight).squeeze(0)
 
-    # Save the marker.
+    # Mark a batch of images that are already fitted into the size of the marker.
+    def mark_fitted(self, images: torch.Tensor, transforms: list[tuple[int, int, int, int]], sizes: list[tuple[int, int]]):
+        if len(images.shape) != 4:
+            raise ValueError(f"Unsupported tensor shape: {images.shape}")
+
+        self.model.eval()
+
+        with torch.no_grad(), autocast(self.device, self.precision):
+            outputs = torch.sigmoid(self.forward(images.to(self.device)).float())
+
+            return [unfit_tensor(output, transform, size[0], size[1]).squeeze(0) for output, transform, size in zip(outputs, transforms, sizes)]
+
+    # Compile the model for the size of the marker, the compiled model is cached next to the checkpoint.
+    def compile(self, path: Path):
+        example = torch.zeros((1, 3, self.height, self.width), device=self.device)
+
+        with autocast(self.device, self.precision):
+            self.compiled_model = trace_model(self.model, example, path, path.with_name(f"{path.stem}.{self.device.type}.{self.precision}.{self.width}x{self.height}.pt"))
+
+    # Forward the model, the compiled model is used when it matches the input size.
+    def forward(self, images: torch.Tensor):
+        if self.compiled_model is not None and images.shape[2] == self.height and images.shape[3] == self.width:
+            return self.compiled_model(images)
+
+        return self.model(images)
+
+    # Save the marker, the file is replaced atomically.
     def save(self, path: Path):
+        if self.fused:
+            raise Exception("Cannot save a marker that is fused for inference")
+
+        temporary_path = path.with_name(f".{path.name}.tmp")
+
         torch.save({
             "width": self.width,
             "height": self.height,
             "depth": self.depth,
+            "precision": self.precision,
 
             "loss": self.loss,
             "iterations": self.iterations,
 
+            "batch_size": self.batch_size,
+            "workers": self.workers,
+            "prefetch": self.prefetch,
+            "accumulation": self.accumulation,
+            "flip": self.preprocessor.flip,
+            "crop": self.preprocessor.crop,
+            "bucket": self.preprocessor.buckets != None,
+
+            "position": self.position,
+
             "model_state": self.model.state_dict(),
-            "optimizer_state": self.optimizer.state_dict()
+            "optimizer_state": self.optimizer.state_dict(),
+            "scaler_state": self.scaler.state_dict()
+        }, str(temporary_path))
+
+        os.replace(temporary_path, path)
+
+    # Export the model of the marker for inference only.
+    def export(self, path: Path, half: bool = False):
+        if self.fused:
+            raise Exception("Cannot export a marker that is fused for inference")
+
+        torch.save({
+            "width": self.width,
+            "height": self.height,
+            "depth": self.depth,
+            "precision": self.precision,
+
+            "loss": self.loss,
+            "iterations": self.iterations,
+
+            "model_state": {name: tensor.half() if half and tensor.is_floating_point() else tensor for name, tensor in self.model.state_dict().items()}
         }, str(path))
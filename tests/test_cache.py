@@ -0,0 +1,51 @@
+from tempfile import TemporaryDirectory
+from unittest import mock
+from pathlib import Path
+import torchvision
+import unittest
+import torch
+
+from dekun.core.cache import TensorCache
+from dekun.core.dataset import Dataset
+
+# Check that the tensor cache takes the state of the entries from the dataset manifest.
+class CacheTest(unittest.TestCase):
+
+    # Create a dataset with a number of entries.
+    def create_dataset(self, directory: Path, amount: int):
+        for index in range(amount):
+            torchvision.io.write_jpeg(torch.randint(0, 256, (3, 16, 24), dtype=torch.uint8), str(directory.joinpath(f"pixiv-{index}-0-test-image.jpg")))
+            torchvision.io.write_png(torch.randint(0, 256, (1, 16, 24), dtype=torch.uint8), str(directory.joinpath(f"pixiv-{index}-0-test-mask.png")))
+
+        return Dataset(directory)
+
+    # Update an up-to-date cache without checking the files of the entries.
+    def test_update_without_stat(self):
+        with TemporaryDirectory() as directory:
+            dataset = self.create_dataset(Path(directory), 8)
+
+            self.assertEqual(TensorCache(dataset, 16, 16).update(1), 8)
+
+            cache = TensorCache(Dataset(Path(directory)), 16, 16)
+
+            with mock.patch.object(Path, "stat", autospec=True, side_effect=Path.stat) as stat:
+                self.assertEqual(cache.update(1), 0)
+
+            self.assertFalse(any("-image" in str(call.args[0]) or "-mask" in str(call.args[0]) for call in stat.call_args_list))
+
+    # Rebuild an entry when the dataset replaces its files.
+    def test_update_changed_entry(self):
+        with TemporaryDirectory() as directory:
+            dataset = self.create_dataset(Path(directory), 2)
+            cache = TensorCache(dataset, 16, 16)
+            cache.update(1)
+
+            entry = dataset.get(dataset.list()[0])
+            torchvision.io.write_png(torch.zeros((1, 16, 24), dtype=torch.uint8), str(entry.mask_path))
+            dataset.add(entry.info, entry.image_path, entry.mask_path)
+
+            self.assertEqual(cache.update(1), 1)
+            self.assertEqual(int(cache.get(entry.name)[1].max()), 0)
+
+if __name__ == "__main__":
+    unittest.main()
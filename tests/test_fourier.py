@@ -0,0 +1,78 @@
+import unittest
+import torch
+
+from dekun.core.lama import FourierUnit, FFCResidualBlock, LaMaGenerator
+
+# Forward a fourier unit the way it was before the spectrum was built through views.
+def forward_reference(unit: FourierUnit, input: torch.Tensor):
+    fft = torch.fft.rfft2(input, norm="ortho")
+    processed = unit.convolutional(torch.cat([fft.real, fft.imag], dim=1))
+    half_channels = processed.shape[1] // 2
+
+    return torch.fft.irfft2(torch.complex(processed[:, :half_channels], processed[:, half_channels:]), s=(input.shape[2], input.shape[3]), norm="ortho")
+
+# Randomize the running statistics of the batch normalizations, so the folding is not an identity.
+def randomize_statistics(module: torch.nn.Module):
+    for layer in module.modules():
+        if isinstance(layer, torch.nn.BatchNorm2d):
+            layer.running_mean.uniform_(-0.5, 0.5)
+            layer.running_var.uniform_(0.5, 2.0)
+            layer.weight.data.uniform_(0.5, 1.5)
+            layer.bias.data.uniform_(-0.2, 0.2)
+
+# Check that the fourier unit and the folded batch normalizations match the unoptimized forward.
+class FourierTest(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(0)
+
+    # Compare the fourier unit and its gradients with the reference forward.
+    def test_fourier_unit(self):
+        unit = FourierUnit(16, 16)
+        input = torch.randn((2, 16, 24, 32), requires_grad=True)
+        reference_input = input.detach().clone().requires_grad_()
+
+        output = unit(input)
+        output.square().sum().backward()
+        gradients = [parameter.grad.clone() for parameter in unit.parameters()]
+        unit.zero_grad()
+
+        reference = forward_reference(unit, reference_input)
+        reference.square().sum().backward()
+
+        torch.testing.assert_close(output, reference)
+        torch.testing.assert_close(input.grad, reference_input.grad)
+
+        for gradient, parameter in zip(gradients, unit.parameters()):
+            torch.testing.assert_close(gradient, parameter.grad)
+
+    # Compare a fused residual block with the unfused block.
+    def test_fused_block(self):
+        block = FFCResidualBlock(32)
+        randomize_statistics(block)
+        block.eval()
+
+        input = torch.randn((2, 32, 16, 16))
+
+        with torch.no_grad():
+            expected = block(input)
+            block.fuse()
+
+            torch.testing.assert_close(block(input), expected, rtol=1e-5, atol=1e-5)
+
+    # Compare a fused generator with the unfused generator.
+    def test_fused_generator(self):
+        generator = LaMaGenerator(mid_channels=8, down_amount=2, residual_amount=2)
+        randomize_statistics(generator)
+        generator.eval()
+
+        input = torch.randn((1, 4, 32, 32))
+
+        with torch.no_grad():
+            expected = generator(input)
+            generator.fuse_for_inference()
+
+            torch.testing.assert_close(generator(input.contiguous(memory_format=torch.channels_last)), expected, rtol=1e-5, atol=1e-5)
+
+if __name__ == "__main__":
+    unittest.main()
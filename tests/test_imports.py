@@ -0,0 +1,34 @@
+from pathlib import Path
+import subprocess
+import unittest
+import dekun
+import sys
+import os
+
+# Run python code in a fresh interpreter and get the names of the loaded heavy modules.
+def heavy_modules(code: str):
+    environment = os.environ.copy()
+    environment["PYTHONPATH"] = os.pathsep.join([str(Path(dekun.__file__).parent.parent), environment.get("PYTHONPATH", "")])
+
+    result = subprocess.run([sys.executable, "-c", f"{code}\nimport sys\nprint('modules:' + ','.join(sorted(name for name in ['torch', 'torchvision', 'numpy', 'starlette', 'hypercorn', 'httpx'] if name in sys.modules)))"], env=environment, capture_output=True, text=True, check=True)
+
+    return [line for line in result.stdout.splitlines() if line.startswith("modules:")][-1][len("modules:"):]
+
+# Check that importing the package and showing the help do not import torch or the web stack.
+class ImportTest(unittest.TestCase):
+
+    # Import the package.
+    def test_import(self):
+        self.assertEqual(heavy_modules("import dekun"), "")
+
+    # Run the package as a module with --help, like python -m dekun --help.
+    def test_module_help(self):
+        self.assertEqual(heavy_modules("import runpy\nimport sys\nsys.argv = ['dekun', '--help']\ntry:\n    runpy.run_module('dekun', run_name='__main__')\nexcept SystemExit:\n    pass"), "")
+
+    # Show the help of the root command and of the subcommands.
+    def test_help(self):
+        for arguments in [["--help"], ["marker", "train", "--help"], ["inpainter", "--help"], ["playground", "--help"]]:
+            self.assertEqual(heavy_modules(f"import dekun\ntry:\n    dekun.root_command({arguments!r})\nexcept SystemExit:\n    pass"), "", arguments)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+from tempfile import TemporaryDirectory
+from pathlib import Path
+import torchvision
+import unittest
+import torch
+
+from dekun.core.pack import Pack, pack_dataset
+from dekun.core.dataset import Dataset
+
+# Check that a packed dataset is split evenly between the processes.
+class PackTest(unittest.TestCase):
+
+    # Create a packed dataset with a number of entries.
+    def create_pack(self, directory: Path, amount: int, shard_size: int):
+        dataset_directory = directory.joinpath("dataset")
+        dataset_directory.mkdir()
+
+        for index in range(amount):
+            torchvision.io.write_jpeg(torch.randint(0, 256, (3, 16, 24), dtype=torch.uint8), str(dataset_directory.joinpath(f"pixiv-{index}-0-test-image.jpg")))
+            torchvision.io.write_png(torch.randint(0, 256, (1, 16, 24), dtype=torch.uint8), str(dataset_directory.joinpath(f"pixiv-{index}-0-test-mask.png")))
+
+        pack_dataset(Dataset(dataset_directory), directory.joinpath("pack"), shard_size)
+
+        return Pack(directory.joinpath("pack"))
+
+    # Split a pack with a single shard between processes, every process should get half of the entries.
+    def test_split_single_shard(self):
+        with TemporaryDirectory() as directory:
+            pack = self.create_pack(Path(directory), 9, 1 << 30)
+            streams = [[entry[0] for entry in pack.iterate(4, rank, 3, seed=1)] for rank in range(3)]
+
+            self.assertEqual(len(pack.shards), 1)
+            self.assertEqual([len(stream) for stream in streams], [3, 3, 3])
+            self.assertEqual(len(set(name for stream in streams for name in stream)), 9)
+
+    # Split a pack with uneven shards between processes, no entry should be dropped or repeated.
+    def test_split_uneven_shards(self):
+        with TemporaryDirectory() as directory:
+            pack = self.create_pack(Path(directory), 11, 2048)
+            streams = [[entry[0] for entry in pack.iterate(4, rank, 2, seed=3)] for rank in range(2)]
+
+            self.assertGreater(len(pack.shards), 2)
+            self.assertLessEqual(abs(len(streams[0]) - len(streams[1])), 1)
+            self.assertEqual(sorted(name for stream in streams for name in stream), sorted(f"pixiv-{index}-0-test" for index in range(11)))
+
+    # Iterate with the same seed twice, the order should be the same.
+    def test_same_seed_same_order(self):
+        with TemporaryDirectory() as directory:
+            pack = self.create_pack(Path(directory), 6, 2048)
+
+            self.assertEqual([entry[0] for entry in pack.iterate(2, 0, 2, seed=5)], [entry[0] for entry in pack.iterate(2, 0, 2, seed=5)])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+from tempfile import TemporaryDirectory
+from pathlib import Path
+import unittest
+import torch
+
+from dekun.inpainter.model import Inpainter
+from dekun.marker.model import Marker
+
+# Check that a checkpoint can be loaded with a different precision than the one it was saved with.
+class PrecisionTest(unittest.TestCase):
+
+    # Save a marker with every precision and load it with every other precision.
+    def test_marker_switch_precision(self):
+        with TemporaryDirectory() as directory:
+            for saved in ["fp32", "bf16", "fp16"]:
+                path = Path(directory).joinpath(f"marker-{saved}.pth")
+                Marker("cpu", 32, 32, 2, saved).save(path)
+
+                for loaded in ["fp32", "bf16", "fp16"]:
+                    marker = Marker.load("cpu", path, loaded, training=True)
+
+                    self.assertEqual(marker.precision, loaded)
+                    self.assertEqual(marker.scaler.is_enabled(), loaded == "fp16")
+
+    # Save an inpainter with fp32 and load it with fp16.
+    def test_inpainter_switch_precision(self):
+        with TemporaryDirectory() as directory:
+            path = Path(directory).joinpath("inpainter.pth")
+            Inpainter("cpu", 64, 64, "fp32").save(path)
+
+            inpainter = Inpainter.load("cpu", path, "fp16")
+
+            self.assertEqual(inpainter.precision, "fp16")
+            self.assertTrue(inpainter.scaler.is_enabled())
+
+    # Keep the scaler state of a checkpoint that was saved with fp16.
+    def test_keep_scaler_state(self):
+        with TemporaryDirectory() as directory:
+            path = Path(directory).joinpath("marker.pth")
+            marker = Marker("cpu", 32, 32, 2, "fp16")
+            marker.scaler.scale(torch.ones(()))
+            marker.scaler.update(1024.0)
+            marker.save(path)
+
+            self.assertEqual(Marker.load("cpu", path, training=True).scaler.get_scale(), 1024.0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from tempfile import TemporaryDirectory
+from threading import Thread
+from pathlib import Path
+import unittest
+import asyncio
+import gzip
+
+from dekun.core.editor.cache import ResourceCache
+from dekun.core.editor.proxy import Proxy
+
+# An upstream that serves a resource with validators and records the requests.
+class UpstreamHandler(BaseHTTPRequestHandler):
+    requests: list[dict[str, str]] = []
+    body = b"resource" * 1024
+
+    # Serve a resource.
+    def do_GET(self):
+        UpstreamHandler.requests.append(dict(self.headers))
+
+        if self.path == "/gzip":
+            body = gzip.compress(UpstreamHandler.body)
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+
+            for index in range(0, len(body), 64):
+                self.wfile.write(body[index:index + 64])
+                self.wfile.flush()
+
+            return
+
+        if self.headers.get("If-None-Match") == "\"1\"":
+            self.send_response(304)
+            self.end_headers()
+
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(UpstreamHandler.body)))
+        self.send_header("ETag", "\"1\"")
+        self.send_header("Last-Modified", "Sun, 18 Oct 2026 00:00:00 GMT")
+        self.end_headers()
+        self.wfile.write(UpstreamHandler.body)
+
+    # Keep the test output quiet.
+    def log_message(self, *args):
+        pass
+
+# Check the proxy against a local upstream.
+class ProxyTest(unittest.TestCase):
+
+    # Start the upstream.
+    def setUp(self):
+        UpstreamHandler.requests = []
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), UpstreamHandler)
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    # Stop the upstream.
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    # Run a function with a started proxy.
+    def run_proxy(self, function):
+        # Start the proxy, run the function and close the proxy.
+        async def run():
+            proxy = Proxy(4, 2)
+            proxy.start()
+
+            try:
+                return await function(proxy)
+            finally:
+                await proxy.close()
+
+        return asyncio.run(run())
+
+    # Read the body of a response.
+    async def read(self, response):
+        return b"".join([chunk async for chunk in response.body_iterator])
+
+    # Stream a resource from the upstream and keep it in the cache.
+    def test_stream(self):
+        with TemporaryDirectory() as directory:
+            cache = ResourceCache(Path(directory), 1 << 20)
+
+            # Stream the resource twice, the second time from the cache.
+            async def stream(proxy: Proxy):
+                response = await proxy.stream(f"{self.url}/image", {"Cache-Control": "max-age=60"}, cache)
+                body = await self.read(response)
+                cached_response = await proxy.stream(f"{self.url}/image", None, cache)
+
+                return response, body, await self.read(cached_response)
+
+            response, body, cached_body = self.run_proxy(stream)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers["Content-Type"], "image/png")
+            self.assertEqual(response.headers["Cache-Control"], "max-age=60")
+            self.assertEqual(body, UpstreamHandler.body)
+            self.assertEqual(cached_body, UpstreamHandler.body)
+            self.assertEqual(len(UpstreamHandler.requests), 1)
+
+            info = cache.get(f"{self.url}/image")
+
+            self.assertNotEqual(info, None)
+            self.assertEqual(info["etag"], "\"1\"")
+            self.assertEqual(info["size"], len(UpstreamHandler.body))
+
+    # Revalidate a stale resource and serve it from the cache when the upstream has not changed it.
+    def test_revalidate(self):
+        with TemporaryDirectory() as directory:
+            cache = ResourceCache(Path(directory), 1 << 20, 0)
+
+            # Stream the resource twice, the second time with a revalidation.
+            async def stream(proxy: Proxy):
+                await self.read(await proxy.stream(f"{self.url}/image", None, cache))
+
+                response = await proxy.stream(f"{self.url}/image", None, cache)
+
+                return response, await self.read(response)
+
+            response, body = self.run_proxy(stream)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(body, UpstreamHandler.body)
+            self.assertEqual(len(UpstreamHandler.requests), 2)
+            self.assertEqual(UpstreamHandler.requests[1].get("If-None-Match"), "\"1\"")
+            self.assertEqual(UpstreamHandler.requests[1].get("If-Modified-Since"), "Sun, 18 Oct 2026 00:00:00 GMT")
+
+    # Pass the encoded body through as it is sent by the upstream.
+    def test_stream_passthrough(self):
+        # Stream the resource without a cache.
+        async def stream(proxy: Proxy):
+            response = await proxy.stream(f"{self.url}/gzip")
+            chunks = [chunk async for chunk in response.body_iterator]
+
+            return response, chunks
+
+        response, chunks = self.run_proxy(stream)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(b"".join(chunks)), UpstreamHandler.body)
+        self.assertEqual(response.headers["Content-Length"], str(len(b"".join(chunks))))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import torch
+
+from dekun.inpainter.model import Inpainter
+
+# Check that the region mode of the inpainter only processes the regions around the mask.
+class RegionTest(unittest.TestCase):
+
+    # Create an inpainter that records the amount of pixels the generator processes.
+    def create_inpainter(self):
+        inpainter = Inpainter("cpu", 128, 128)
+        inpainter.pixels = 0
+        forward = inpainter.forward
+
+        # Forward the generator and record the pixels.
+        def record(input: torch.Tensor):
+            inpainter.pixels += input.shape[0] * input.shape[2] * input.shape[3]
+
+            return forward(input)
+
+        inpainter.forward = record
+
+        return inpainter
+
+    # Create a page with small holes in its corners.
+    def create_page(self):
+        image = torch.rand((3, 256, 256))
+        mask = torch.zeros((1, 256, 256))
+
+        for x, y in [(20, 20), (220, 20), (20, 220), (220, 220)]:
+            mask[:, y:y + 8, x:x + 8] = 1
+
+        return image, mask
+
+    # Inpaint the page with the region mode and the fit mode, the region mode should process fewer pixels.
+    def test_fewer_pixels_than_fit(self):
+        image, mask = self.create_page()
+
+        regions = self.create_inpainter()
+        output = regions.inpaint_regions(image, mask, margin=8)
+
+        fit = self.create_inpainter()
+        fit.inpaint(image, mask)
+
+        self.assertLess(regions.pixels, fit.pixels)
+        self.assertEqual(output.shape, image.shape)
+        self.assertTrue(torch.equal(output[:, mask[0] <= 0.5], image[:, mask[0] <= 0.5]))
+
+    # Inpaint a region that is larger than the inpainter, the region should be scaled down to the size of the inpainter.
+    def test_scale_large_region(self):
+        inpainter = self.create_inpainter()
+        image = torch.rand((3, 300, 300))
+        mask = torch.zeros((1, 300, 300))
+        mask[:, 10:290, 10:290] = 1
+
+        output = inpainter.inpaint_regions(image, mask, margin=8)
+
+        self.assertEqual(output.shape, image.shape)
+        self.assertLessEqual(inpainter.pixels, 128 * 128)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+from tempfile import TemporaryDirectory
+from pathlib import Path
+import unittest
+import asyncio
+import httpx
+
+from dekun.core.editor.cache import ResourceCache
+
+# Check that the resource cache serves the resources it evicts safely.
+class ResourceCacheTest(unittest.TestCase):
+
+    # Store a resource into the cache.
+    def store(self, cache: ResourceCache, key: str, content: bytes):
+        writer = cache.writer(key, httpx.Response(200, headers={"Content-Type": "image/png", "ETag": "\"a\""}))
+
+        assert writer is not None
+
+        writer.write(content)
+        writer.commit()
+
+    # Read the body of a response.
+    def read(self, response):
+        # Join the chunks of the body.
+        async def join():
+            return b"".join([chunk async for chunk in response.body_iterator])
+
+        return asyncio.run(join())
+
+    # Send a resource that is evicted after it is opened.
+    def test_respond_then_evict(self):
+        with TemporaryDirectory() as directory:
+            cache = ResourceCache(Path(directory), 8)
+            self.store(cache, "a", b"1234")
+
+            response = cache.respond("a")
+            self.store(cache, "b", b"56789")
+
+            self.assertEqual(cache.get("a"), None)
+            self.assertEqual(response.headers["Content-Length"], "4")
+            self.assertEqual(self.read(response), b"1234")
+
+    # Treat an evicted resource as a miss.
+    def test_respond_evicted(self):
+        with TemporaryDirectory() as directory:
+            cache = ResourceCache(Path(directory), 8)
+            self.store(cache, "a", b"1234")
+
+            info = cache.get("a")
+            self.store(cache, "b", b"56789")
+
+            self.assertNotEqual(info, None)
+            self.assertEqual(cache.respond("a"), None)
+
+    # Treat a resource whose file is gone as a miss.
+    def test_respond_missing_file(self):
+        with TemporaryDirectory() as directory:
+            cache = ResourceCache(Path(directory), 8)
+            self.store(cache, "a", b"1234")
+
+            Path(directory).joinpath(f"{cache.name('a')}.bin").unlink()
+
+            self.assertEqual(cache.respond("a"), None)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+from tempfile import TemporaryDirectory
+from pathlib import Path
+import torchvision
+import unittest
+import torch
+
+from dekun.core.bucket import BucketSampler
+from dekun.core.sampler import ResumableSampler
+from dekun.core.dataset import Dataset
+
+# Check that the resumable samplers only count what is left of a resumed epoch.
+class ResumeTest(unittest.TestCase):
+
+    # Resume a sampler after a number of batches, the length should match the remaining indices.
+    def test_sampler_length(self):
+        sampler = ResumableSampler(10, 0, 2)
+        self.assertEqual(len(sampler), 5)
+
+        sampler.resume(0, 1, 2)
+
+        self.assertEqual(len(sampler), 3)
+        self.assertEqual(len(sampler), len(list(sampler)))
+
+    # Resume past the end of an epoch, the length should not be negative.
+    def test_sampler_length_past_end(self):
+        sampler = ResumableSampler(4)
+        sampler.resume(0, 3, 2)
+
+        self.assertEqual(len(sampler), 0)
+        self.assertEqual(list(sampler), [])
+
+    # Resume a bucket sampler after a number of batches, the length should match the remaining batches.
+    def test_bucket_sampler_length(self):
+        with TemporaryDirectory() as directory:
+            for index, (width, height) in enumerate([(32, 32), (32, 32), (32, 32), (16, 64), (16, 64)]):
+                torchvision.io.write_jpeg(torch.randint(0, 256, (3, height, width), dtype=torch.uint8), str(Path(directory).joinpath(f"pixiv-{index}-0-test-image.jpg")))
+                torchvision.io.write_png(torch.randint(0, 256, (1, height, width), dtype=torch.uint8), str(Path(directory).joinpath(f"pixiv-{index}-0-test-mask.png")))
+
+            sampler = BucketSampler(Dataset(Path(directory)), [(32, 32), (16, 64)], 2)
+
+            self.assertEqual(len(sampler), 3)
+
+            sampler.resume(0, 2, 2)
+
+            self.assertEqual(len(sampler), 1)
+            self.assertEqual(len(sampler), len(list(sampler)))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import torch
+
+from dekun.core.tuning import is_out_of_memory, find_batch_size, find_worker_amount, preserve_buffers
+from dekun.marker.model import Marker
+
+# Check the batch size search.
+class TuningTest(unittest.TestCase):
+
+    # Detect the out of memory errors of the CUDA and the CPU allocators.
+    def test_out_of_memory(self):
+        self.assertTrue(is_out_of_memory(RuntimeError("CUDA out of memory. Tried to allocate 2.00 GiB")))
+        self.assertTrue(is_out_of_memory(RuntimeError("[enforce fail at alloc_cpu.cpp:121] data. DefaultCPUAllocator: can't allocate memory: you tried to allocate 68719476736 bytes. Error code 12 (Cannot allocate memory)")))
+        self.assertTrue(is_out_of_memory(MemoryError()))
+        self.assertFalse(is_out_of_memory(RuntimeError("mat1 and mat2 shapes cannot be multiplied")))
+
+    # Stop the search at the first batch size the CPU allocator cannot fit.
+    def test_stop_at_cpu_out_of_memory(self):
+        # Run a step that runs out of memory above a batch size of 4.
+        def step(batch_size: int):
+            if batch_size > 4:
+                raise RuntimeError("DefaultCPUAllocator: can't allocate memory: you tried to allocate 68719476736 bytes. Error code 12 (Cannot allocate memory)")
+
+        batch_size, results = find_batch_size(step, torch.device("cpu"), 64, 1)
+
+        self.assertEqual(batch_size, 4)
+        self.assertEqual(sorted(results), [1, 2, 4])
+
+    # Keep the running statistics of the batch normalizations through a probe.
+    def test_probe_keeps_buffers(self):
+        marker = Marker("cpu", 32, 32, 2)
+        buffers = {name: buffer.clone() for name, buffer in marker.model.named_buffers()}
+
+        marker.probe(2)
+
+        for name, buffer in marker.model.named_buffers():
+            self.assertTrue(torch.equal(buffer, buffers[name]), name)
+
+    # Restore the buffers even when the block fails.
+    def test_preserve_buffers_on_error(self):
+        normalization = torch.nn.BatchNorm2d(4)
+
+        with self.assertRaises(RuntimeError):
+            with preserve_buffers(normalization):
+                normalization(torch.rand((2, 4, 8, 8)))
+
+                raise RuntimeError("out of memory")
+
+        self.assertTrue(torch.equal(normalization.running_mean, torch.zeros(4)))
+        self.assertEqual(int(normalization.num_batches_tracked), 0)
+
+    # Keep the default worker amount when a single batch leaves nothing to measure.
+    def test_worker_amount_without_throughput(self):
+        workers, results = find_worker_amount(lambda workers: [torch.zeros(1)], 4, 100.0, 4, default=3)
+
+        self.assertEqual(workers, 3)
+        self.assertEqual(sorted(results), [0, 1, 2, 4])
+
+    # Stop at the first worker amount that reaches the target.
+    def test_worker_amount_reaches_target(self):
+        workers, _ = find_worker_amount(lambda workers: [torch.zeros(1)] * (1 if workers < 2 else 9), 4, 1.0, 4, default=3)
+
+        self.assertEqual(workers, 2)
+
+if __name__ == "__main__":
+    unittest.main()